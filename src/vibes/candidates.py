@@ -0,0 +1,131 @@
+"""Generate several candidate commit messages, and rank them locally."""
+
+import asyncio
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from pydantic_ai import Agent
+from pydantic_ai.agent import AgentRunResult
+
+from vibes.llm import CommitMessageResponse
+from vibes.prompt import MESSAGE_STYLE, split_header
+
+MAX_HEADER_LENGTH = 72
+MIN_WORD_LENGTH = 3
+
+# diversify the candidates by style, since not all models support temperature
+STYLE_HINTS = [
+    "",
+    "Prefer a short and terse header.",
+    "Focus the header on the user-facing effect of the change.",
+    "Focus the header on the main code area that was changed.",
+    "Focus the body on the motivation for the change.",
+]
+
+_VARIATION_SELECTOR = "\ufe0f"
+
+
+def parse_gitmojis(message_style: str) -> set[str]:
+    """Get the emojis listed in the style table, as `<emoji> = <meaning>` lines."""
+    return {
+        match.group(1).replace(_VARIATION_SELECTOR, "")
+        for match in re.finditer(r"^(\S+) = ", message_style, flags=re.MULTILINE)
+    }
+
+
+GITMOJIS = parse_gitmojis(MESSAGE_STYLE)
+
+
+@dataclass(frozen=True, slots=True)
+class Candidate:
+    """A candidate commit message, with its local ranking score."""
+
+    result: AgentRunResult[CommitMessageResponse]
+    score: float
+    problems: tuple[str, ...]
+
+    @property
+    def response(self) -> CommitMessageResponse:
+        """The structured response of the candidate."""
+        return self.result.output
+
+
+def _has_valid_gitmojis(emojis: str, gitmojis: set[str]) -> bool:
+    remaining = emojis.replace(_VARIATION_SELECTOR, "").replace(" ", "")
+    if not remaining:
+        return False
+    for gitmoji in sorted(gitmojis, key=len, reverse=True):
+        remaining = remaining.replace(gitmoji, "")
+    return not remaining
+
+
+def _words(text: str) -> set[str]:
+    return {
+        word
+        for word in re.split(r"[^a-z0-9]+", text.lower())
+        if len(word) >= MIN_WORD_LENGTH
+    }
+
+
+def path_similarity(message: str, touched_paths: Iterable[str]) -> float:
+    """Get the fraction of words from the touched paths that the message mentions."""
+    path_words: set[str] = set().union(*(_words(path) for path in touched_paths))
+    if not path_words:
+        return 0.0
+    return len(path_words & _words(message)) / len(path_words)
+
+
+def score_message(
+    message: str, touched_paths: Iterable[str], gitmojis: set[str] = GITMOJIS
+) -> tuple[float, tuple[str, ...]]:
+    """Score a commit message locally, and list its problems."""
+    header = message.strip().split("\n", 1)[0]
+    emojis, scope, description = split_header(header)
+    problems = []
+    if len(header) > MAX_HEADER_LENGTH:
+        problems.append(f"header is longer than {MAX_HEADER_LENGTH} chars")
+    if not _has_valid_gitmojis(emojis, gitmojis):
+        problems.append("header doesn't start with a gitmoji")
+    # a second scope group, or the scope repeated as a prefix of the description
+    if scope and description.lower().startswith(
+        ("(", f"{scope.lower()}:", f"{scope.lower()} ")
+    ):
+        problems.append("header has a duplicated scope")
+    score = -len(problems) + path_similarity(message, touched_paths)
+    return score, tuple(problems)
+
+
+async def generate_candidates(
+    agent: Agent[None, CommitMessageResponse], prompt: str, n: int
+) -> list[AgentRunResult[CommitMessageResponse]]:
+    """Ask the model for `n` diverse commit messages, concurrently.
+
+    Failed requests are dropped, unless all of them failed.
+    """
+    prompts = [
+        f"{prompt}\n\n## Style hint\n{hint}" if hint else prompt
+        for hint in (STYLE_HINTS[i % len(STYLE_HINTS)] for i in range(n))
+    ]
+    results = await asyncio.gather(
+        *(agent.run(p) for p in prompts),
+        return_exceptions=True,
+    )
+    successful = [r for r in results if not isinstance(r, BaseException)]
+    if not successful:
+        errors = [r for r in results if isinstance(r, BaseException)]
+        raise errors[0]
+    return successful
+
+
+def rank_candidates(
+    results: Iterable[AgentRunResult[CommitMessageResponse]],
+    touched_paths: Iterable[str],
+) -> list[Candidate]:
+    """Rank the candidates, best first."""
+    touched_paths = list(touched_paths)
+    candidates = []
+    for result in results:
+        score, problems = score_message(result.output.message, touched_paths)
+        candidates.append(Candidate(result, score, problems))
+    return sorted(candidates, key=lambda c: c.score, reverse=True)
@@ -1,32 +1,243 @@
 """Get a commit message from ChatGPT, with emojies! ✨."""
 
-import os
+import asyncio
 import sys
+import time
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Annotated
 
 import git
 from cyclopts import App, Parameter, validators
-from pydantic import BaseModel
 from pydantic_ai import Agent
+from pydantic_ai.agent import AgentRunResult
 
-from vibes import config
-from vibes.prompt import get_prompt
+from vibes import config, history, session
+from vibes import workspace as workspace_mod
+from vibes.candidates import Candidate, generate_candidates, rank_candidates
+from vibes.diff import estimate_tokens, format_savings, split_diff
+from vibes.ledger import (
+    Ledger,
+    UsageContext,
+    diff_size_bucket,
+    get_ledger_path,
+    get_stats,
+    usage_context,
+)
+from vibes.llm import (
+    CommitMessageResponse,
+    count_retries,
+    describe_agent,
+    format_response,
+    get_agent,
+)
+from vibes.prompt import (
+    format_delta_prompt,
+    format_prompt,
+    read_repo_info,
+    split_commit_range,
+)
+from vibes.singleflight import FlightResult, flight_key, single_flight
 
+app = App(name="vibes")
+app.register_install_completion_command()
 
-class CommitMessageResponse(BaseModel):
-    """Structured response for commit message generation."""
 
-    message: str
-    emoji_legend: dict[str, str]
+def _pick_candidate(candidates: list[Candidate]) -> Candidate:
+    """Let the user pick a candidate from a numbered list (default is the top)."""
+    while True:
+        try:
+            choice = input(f"\n\nPick a message [1-{len(candidates)}, default 1]: ")
+        except (EOFError, KeyboardInterrupt):
+            return candidates[0]
+        if not choice.strip():
+            return candidates[0]
+        if choice.strip().isdigit() and 1 <= int(choice) <= len(candidates):
+            return candidates[int(choice) - 1]
 
 
-app = App(name="vibes")
-app.register_install_completion_command()
+@dataclass(frozen=True, slots=True)
+class _RepoState:
+    """What main needs to know about the repo."""
+
+    repo_info: dict[str, str]
+    session_path: Path | None
+    head: str
+    examples: str
+
+
+def _load_settings(
+    path: Path, profile: str | None, overrides: dict[str, int | bool | None]
+) -> tuple[config.Settings, Path | None]:
+    """Get the settings of the repo, and its root dir, with the CLI overrides."""
+    try:
+        with git.Repo(path, search_parent_directories=True) as repo:
+            working_tree_dir = repo.working_tree_dir
+    except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+        # not a repo, so there is no repo-local config
+        working_tree_dir = None
+    repo_dir = Path(working_tree_dir) if working_tree_dir else None
+    try:
+        settings = config.get_settings(profile, repo_dir)
+    except ValueError as e:
+        print("Error:", str(e), file=sys.stderr)
+        sys.exit(1)
+    update = {key: value for key, value in overrides.items() if value is not None}
+    return settings.model_copy(update=update), repo_dir
+
+
+def _read_repo(path: Path, commit: str, settings: config.Settings) -> _RepoState:
+    """Get the repo info, the session path, the HEAD sha and the examples."""
+    try:
+        with git.Repo(path, search_parent_directories=True) as repo:
+            result = read_repo_info(
+                repo,
+                commit,
+                adaptive_diff=settings.adaptive_diff,
+                max_diff_tokens=settings.max_diff_tokens,
+            )
+            repo_info = result.repo_info
+            # sessions are kept only for the uncommitted changes
+            session_path = (
+                None if commit or repo.bare else session.get_session_path(repo)
+            )
+            head = repo.head.commit.hexsha if repo.head.is_valid() else ""
+            # don't use the analyzed commits as examples
+            exclude = (
+                [c.hexsha for c in repo.iter_commits(_commit_range(repo, commit))]
+                if commit
+                else []
+            )
+            examples_text = history.get_examples(
+                repo, split_diff(repo_info["git_diff"]), settings.few_shot, exclude
+            )
+            repo_dir = Path(repo.working_tree_dir or repo.git_dir)
+            usage_context.set(
+                UsageContext(
+                    repo=repo_dir.resolve().name,
+                    diff_size=diff_size_bucket(len(repo_info["git_diff"])),
+                )
+            )
+    except git.exc.InvalidGitRepositoryError:
+        print(f"Error: {path} is not a valid git repository", file=sys.stderr)
+        sys.exit(1)
+    except (git.exc.BadName, git.exc.GitCommandError) as e:
+        # e.g. a partial clone, whose remote can't serve the missing blobs
+        print("Error:", str(e), file=sys.stderr)
+        sys.exit(1)
+    if result.plain_diff_tokens is not None:
+        tokens = estimate_tokens(repo_info["git_diff"])
+        print(format_savings(result.plain_diff_tokens, tokens), file=sys.stderr)
+    return _RepoState(repo_info, session_path, head, examples_text)
+
+
+def _commit_range(repo: git.Repo, commit: str) -> str:
+    commit_start, commit_end = split_commit_range(repo, commit.replace("@", "HEAD"))
+    return f"{commit_start}..{commit_end}"
+
+
+def _print_retries(result: AgentRunResult[CommitMessageResponse]) -> None:
+    """Tell the user if the model had to retry the structured output."""
+    if retries := count_retries(result):
+        print(f"\n({retries} retries to get a valid output)", file=sys.stderr)
+
+
+async def _run_prompt(
+    agent: Agent[None, CommitMessageResponse], prompt: str
+) -> FlightResult:
+    result = await agent.run(prompt)
+    _print_retries(result)
+    return FlightResult(output=result.output, messages=result.all_messages())
+
+
+def _continue_session(
+    runner: asyncio.Runner,
+    agent: Agent[None, CommitMessageResponse],
+    previous: session.Session,
+    current: session.Session,
+    file_diffs: dict[str, str],
+) -> None:
+    """Send only the files that changed, on top of the previous chat."""
+    updated, removed = previous.changed_files(file_diffs)
+    if not (updated or removed):
+        current.messages = previous.messages
+        current.last_output = previous.last_output
+        return
+    result = runner.run(
+        agent.run(
+            format_delta_prompt(updated, removed),
+            message_history=previous.messages,
+        )
+    )
+    current.messages = result.all_messages()
+    current.last_output = format_response(result.output)
+    _print_retries(result)
+
+
+def _load_previous_session(
+    session_path: Path | None, *, resume: bool, new: bool
+) -> session.Session | None:
+    """Load the previous session, unless a new one is requested."""
+    if resume and new:
+        print("Error: can't use both --resume and --new", file=sys.stderr)
+        sys.exit(1)
+    previous = session.load_session(session_path) if session_path and not new else None
+    if resume and previous is None:
+        print("Error: no previous session to resume", file=sys.stderr)
+        sys.exit(1)
+    return previous
+
+
+def _print_candidates(
+    runner: asyncio.Runner,
+    agent: Agent[None, CommitMessageResponse],
+    prompt: str,
+    candidates: int,
+    file_diffs: dict[str, str],
+) -> list[Candidate]:
+    """Ask for several candidates, and print them ranked."""
+    results = runner.run(generate_candidates(agent, prompt, candidates))
+    ranked = rank_candidates(results, file_diffs)
+    for i, candidate in enumerate(ranked, start=1):
+        problems = "; ".join(candidate.problems) or "no problems"
+        if retries := count_retries(candidate.result):
+            problems += f", {retries} retries"
+        print(f"[{i}] ({problems})")
+        print(format_response(candidate.response))
+        print()
+    return ranked
+
+
+def _chat(
+    runner: asyncio.Runner,
+    agent: Agent[None, CommitMessageResponse],
+    current: session.Session,
+    session_path: Path | None,
+) -> None:
+    """Chat with the LLM, saving the session after each reply."""
+    while True:
+        # Get user input
+        try:
+            user_input = input("\n\nYou: ")
+        except (EOFError, KeyboardInterrupt):
+            break
+        if user_input.lower() in ["exit", "quit", "", "q"]:
+            break
+        # Get assistant reply
+        result = runner.run(
+            agent.run(user_input, message_history=current.messages, output_type=str)
+        )
+        current.messages = result.all_messages()
+        current.last_output = result.output
+        if session_path:
+            session.save_session(session_path, current)
+        print()
+        print()
+        print(result.output)
 
 
 @app.default()
-def main(
+def main(  # noqa: PLR0913
     path: Annotated[
         Path,
         Parameter(
@@ -39,6 +250,16 @@ def main(
     description: Annotated[str, Parameter(alias=("-d"))] = "",
     only_prompt: Annotated[bool, Parameter(negative="")] = False,
     skip_chat: Annotated[bool, Parameter(alias=("-s"))] = False,
+    candidates: Annotated[
+        int | None, Parameter(validator=validators.Number(gte=1))
+    ] = None,
+    resume: Annotated[bool, Parameter(negative="")] = False,
+    new: Annotated[bool, Parameter(negative="")] = False,
+    few_shot: Annotated[
+        int | None, Parameter(validator=validators.Number(gte=0))
+    ] = None,
+    adaptive_diff: bool | None = None,
+    profile: str | None = None,
 ) -> int:
     """Ask the model for a commit message.
 
@@ -54,48 +275,189 @@ def main(
         just print the prompt, don't open it.
     skip_chat
         don't start a chat with the LLM
+    candidates
+        number of messages to request concurrently, and pick from (default 1).
+    resume
+        continue the previous chat about the changes in this branch.
+    new
+        start a new chat, instead of continuing the previous one.
+    few_shot
+        number of similar past commits to show the model, as style examples
+        (default 3).
+    adaptive_diff
+        shrink the diff, by adapting the context and the granularity to each file.
+    profile
+        the settings profile to use, like "fast" or "thorough".
     """
-    try:
-        with git.Repo(path, search_parent_directories=True) as repo:
-            prompt = get_prompt(repo, commit, description=description.strip())
-    except git.exc.InvalidGitRepositoryError:
-        print(f"Error: {path} is not a valid git repository", file=sys.stderr)
-        sys.exit(1)
-    except git.exc.BadName as e:
-        print("Error:", str(e), file=sys.stderr)
-        sys.exit(1)
+    settings, repo_dir = _load_settings(
+        path,
+        profile,
+        {
+            "candidates": candidates,
+            "few_shot": few_shot,
+            "adaptive_diff": adaptive_diff,
+        },
+    )
+    state = _read_repo(path, commit, settings)
+    repo_info, session_path, head = state.repo_info, state.session_path, state.head
+    prompt = format_prompt(repo_info, description.strip(), state.examples)
     if only_prompt:
         print(prompt)
         return 0
 
-    # Set API key in environment (automatically cleaned up when process exits)
-    env_var = f"{config.get_provider().upper()}_API_KEY"
-    os.environ[env_var] = config.get_api_key()
+    file_diffs = split_diff(repo_info["git_diff"])
+    current = session.Session(
+        head=head,
+        prompt_hash=session.hash_prompt(repo_info, description),
+        file_hashes=session.hash_files(file_diffs),
+        messages=[],
+        last_output="",
+    )
+    previous = _load_previous_session(session_path, resume=resume, new=new)
 
-    # Create agent using provider:model string format
-    model_string = f"{config.get_provider()}:{config.get_model()}"
-    agent = Agent(model_string)
+    # one event loop for all the requests, as the HTTP clients are bound to it
+    with asyncio.Runner() as runner, Ledger(get_ledger_path()) as usage_ledger:
+        agent = get_agent(usage_ledger, settings, repo_dir)
+        # Get initial response with structured output
+        if resume and previous is not None:
+            current = previous
+            print(current.last_output)
+        elif (
+            previous is not None
+            and settings.candidates == 1
+            and (previous.head, previous.prompt_hash) == (head, current.prompt_hash)
+        ):
+            _continue_session(runner, agent, previous, current, file_diffs)
+            print(current.last_output)
+        elif settings.candidates == 1:
+            # concurrent runs with the same prompt and model make a single request
+            key = flight_key(prompt, *describe_agent(agent))
+            flight, shared = runner.run(
+                single_flight(key, lambda: _run_prompt(agent, prompt))
+            )
+            current.messages = flight.messages
+            current.last_output = format_response(flight.output)
+            print(current.last_output)
+            if shared:
+                print("\n(reused the output of a concurrent run)", file=sys.stderr)
+        else:
+            ranked = _print_candidates(
+                runner, agent, prompt, settings.candidates, file_diffs
+            )
+            if skip_chat:
+                return 0
+            picked = _pick_candidate(ranked)
+            current.messages = picked.result.all_messages()
+            current.last_output = format_response(picked.response)
+        if session_path:
+            session.save_session(session_path, current)
+            session.prune_sessions(settings.max_sessions)
 
-    # Get initial response with structured output
-    result = agent.run_sync(prompt, output_type=CommitMessageResponse)
-    response = result.output
-    print(response.message)
-    print("\n\nEmoji Legend:")
-    for emoji, meaning in response.emoji_legend.items():
-        print(f"{emoji}: {meaning}")
+        if not skip_chat:
+            _chat(runner, agent, current, session_path)
+    return 0
 
-    # REPL loop
-    while not skip_chat:
-        # Get user input
-        try:
-            user_input = input("\n\nYou: ")
-        except (EOFError, KeyboardInterrupt):
-            break
-        if user_input.lower() in ["exit", "quit", "", "q"]:
-            break
-        # Get assistant reply
-        result = agent.run_sync(user_input, message_history=result.all_messages())  # type: ignore[assignment]
-        print()
+
+@app.command()
+def workspace(
+    root: Annotated[
+        Path, Parameter(validator=validators.Path(exists=True, file_okay=False))
+    ] = Path(),
+    *,
+    description: Annotated[str, Parameter(alias=("-d"))] = "",
+    concurrency: Annotated[
+        int | None, Parameter(validator=validators.Number(gte=1))
+    ] = None,
+    only_prompt: Annotated[bool, Parameter(negative="")] = False,
+    profile: str | None = None,
+) -> int:
+    """Ask the model for a commit message for each dirty repo under a directory.
+
+    Parameters
+    ----------
+    root
+        the directory to search for repos (and submodules).
+    description
+        optional description of the cross-repo change.
+    concurrency
+        maximal number of concurrent LLM requests (default 4).
+    only_prompt
+        just print the prompts, don't open them.
+    profile
+        the settings profile to use, like "fast" or "thorough".
+    """
+    settings, repo_dir = _load_settings(root, profile, {"concurrency": concurrency})
+    repo_paths = workspace_mod.find_dirty_repos(root)
+    if not repo_paths:
+        print(f"Error: no dirty repos found under {root}", file=sys.stderr)
+        return 1
+    repo_infos = {}
+    exit_code = 0
+    for repo_path, repo_info in workspace_mod.gather_repo_infos(
+        repo_paths, settings
+    ).items():
+        if isinstance(repo_info, Exception):
+            name = workspace_mod.repo_name(repo_path, root)
+            print(f"Error: can't read {name}: {repo_info}", file=sys.stderr)
+            exit_code = 1
+        else:
+            repo_infos[repo_path] = repo_info
+    if not repo_infos:
+        return 1
+    prompts = workspace_mod.get_workspace_prompts(
+        repo_infos, root=root, description=description.strip()
+    )
+    if only_prompt:
+        for repo_path, prompt in prompts.items():
+            print(f"# {workspace_mod.repo_name(repo_path, root)}")
+            print(prompt)
+        return exit_code
+
+    with Ledger(get_ledger_path()) as usage_ledger:
+        responses = asyncio.run(
+            workspace_mod.generate_messages(
+                get_agent(usage_ledger, settings, repo_dir),
+                prompts,
+                concurrency=settings.concurrency,
+                usage_contexts=workspace_mod.get_usage_contexts(repo_infos),
+            )
+        )
+    for repo_path, response in responses.items():
+        print(f"# {workspace_mod.repo_name(repo_path, root)}")
+        if isinstance(response, BaseException):
+            print("Error:", str(response), file=sys.stderr)
+            exit_code = 1
+        else:
+            print(format_response(response))
         print()
-        print(result.output)
+    return exit_code
+
+
+@app.command()
+def stats(
+    *, days: Annotated[int, Parameter(validator=validators.Number(gte=1))] = 30
+) -> int:
+    """Show the latency and token usage of the LLM requests, per model.
+
+    Parameters
+    ----------
+    days
+        include only the requests from the last days.
+    """
+    model_stats = get_stats(get_ledger_path(), since=time.time() - days * 24 * 60 * 60)
+    if not model_stats:
+        print(f"Error: no requests recorded in the last {days} days", file=sys.stderr)
+        return 1
+    header = (
+        f"{'model':<30} {'requests':>8} {'p50 [s]':>8} {'p95 [s]':>8} "
+        f"{'tokens/commit':>13} {'cache hit':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for s in model_stats:
+        print(
+            f"{s.model:<30} {s.requests:>8} {s.latency_p50:>8.2f} "
+            f"{s.latency_p95:>8.2f} "
+            f"{s.tokens_per_commit:>13.0f} {s.cache_hit_rate:>9.0%}"
+        )
     return 0
@@ -2,49 +2,269 @@
 
 Configuration is loaded from multiple sources in the following priority order:
 
-1. XDG config file: ~/.config/vibes/config.toml
+1. Repo-local config file: .vibes.toml, at the root of the repo.
+   It has the same structure as the XDG config file, except that it can't set
+   API keys, route to a provider or a model, or select a profile or a number of
+   candidates (a cloned repo shouldn't choose what to spend your key on).
+
+2. XDG config file: ~/.config/vibes/config.toml
    Example structure:
    ```toml
    provider = "anthropic"
+   few_shot = 3
 
    [providers.anthropic]
    api_key = "sk-..."
    model = "claude-sonnet-4-5"
+   output_mode = "tool"  # or "native" (JSON schema), or "prompted"
+
+   [profiles.fast]
+   model = "claude-haiku-4-5"
+   timeout = 20
    ```
 
-2. Environment variables (loaded from .env file or system environment):
+3. Environment variables (loaded from .env file or system environment):
    - VIBES_PROVIDER: Provider name (e.g., "anthropic", "openai", "google")
+   - VIBES_PROFILE: Profile name (e.g., "fast")
+   - VIBES_{SETTING}: Any other setting (e.g., VIBES_FEW_SHOT)
    - {PROVIDER}_API_KEY: API key for the provider (e.g., ANTHROPIC_API_KEY)
    - {PROVIDER}_MODEL: Model name for the provider (e.g., ANTHROPIC_MODEL)
+   - {PROVIDER}_OUTPUT_MODE: Structured output mode (e.g., ANTHROPIC_OUTPUT_MODE)
 
-3. Default models (for model selection only):
+4. Default models (for model selection only):
    - openai: gpt-5
    - anthropic: claude-sonnet-4-5
-   - google: gemini-2.5-pro
+   - google: gemini-3-pro
+
+   The default output mode is "tool".
+
+A profile is a named set of settings, that overrides the other settings when it
+is selected (with `--profile`, or with `profile` or VIBES_PROFILE). The profiles
+"fast" and "thorough" are built in, and can be changed like any other profile.
+
+The configuration is resolved once per repo, on first use, including the
+provider environment variables and the default models.
 """
 
+import functools
 import os
 import tomllib
 from pathlib import Path
+from typing import Literal
 
 from dotenv import load_dotenv
-from platformdirs import user_config_dir
-
-# Load environment variables
-load_dotenv()
+from platformdirs import user_cache_dir, user_config_dir
+from pydantic import BaseModel, ConfigDict, Field
 
-# Try to load from XDG config file if it exists
 config_file = Path(user_config_dir("vibes")) / "config.toml"
-try:
-    with config_file.open("rb") as f:
-        _file_config = tomllib.load(f)
-except FileNotFoundError:
-    _file_config = {}
+REPO_CONFIG_NAME = ".vibes.toml"
+
+# Cache directory, for sessions and other persistent state
+cache_dir = Path(user_cache_dir("vibes"))
+
+DEFAULT_MODELS = {
+    "openai": "gpt-5",
+    "anthropic": "claude-sonnet-4-5",
+    "google": "gemini-3-pro",
+}
+# the settings that a repo-local config file can't set
+PROVIDER_ROUTING = ("provider", "model")
+# the settings that multiply the requests, or may route them
+SPENDING_SETTINGS = ("profile", "candidates")
+
+type OutputMode = Literal["native", "tool", "prompted"]
+type TomlData = dict[str, object]
+
+
+class ProviderConfig(BaseModel):
+    """The configuration of a provider."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    api_key: str | None = None
+    model: str | None = None
+    output_mode: OutputMode = "tool"
+
+
+class Settings(BaseModel):
+    """The settings that a profile can override."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    # model routing
+    provider: str | None = None
+    model: str | None = None
+    # prompt token budget
+    few_shot: int = Field(default=3, ge=0)
+    adaptive_diff: bool = False
+    max_diff_tokens: int | None = Field(default=None, gt=0)
+    # latency
+    candidates: int = Field(default=1, ge=1, le=10)
+    concurrency: int = Field(default=4, ge=1, le=32)
+    timeout: float | None = Field(default=None, gt=0)
+    # cache sizes
+    max_sessions: int = Field(default=100, ge=1)
+
+
+class Config(Settings):
+    """The whole configuration."""
+
+    profile: str | None = None
+    providers: dict[str, ProviderConfig] = {}
+    profiles: dict[str, Settings] = {}
+
+
+BUILTIN_PROFILES: dict[str, TomlData] = {
+    "fast": {
+        "few_shot": 0,
+        "adaptive_diff": True,
+        "max_diff_tokens": 8000,
+        "candidates": 1,
+        "timeout": 30,
+    },
+    "thorough": {"few_shot": 5, "candidates": 3, "timeout": 120},
+}
+
+
+def _read_toml(path: Path) -> TomlData:
+    try:
+        with path.open("rb") as f:
+            return tomllib.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _merge(base: TomlData, override: TomlData) -> TomlData:
+    """Merge two TOML tables, recursively."""
+    merged = dict(base)
+    for key, value in override.items():
+        base_value = merged.get(key)
+        if isinstance(base_value, dict) and isinstance(value, dict):
+            merged[key] = _merge(base_value, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _env_config() -> TomlData:
+    """Get the settings from the VIBES_* environment variables."""
+    env_config: TomlData = {}
+    for name in ["profile", *Settings.model_fields]:
+        value = os.getenv(f"VIBES_{name.upper()}")
+        if value:
+            env_config[name] = value
+    return env_config
+
+
+def _provider_env_config(provider_names: set[str]) -> TomlData:
+    """Get the provider configs from the {PROVIDER}_* environment variables."""
+    providers: TomlData = {}
+    for provider in sorted(provider_names):
+        provider_config = {
+            name: value
+            for name in ProviderConfig.model_fields
+            if (value := os.getenv(f"{provider.upper()}_{name.upper()}"))
+        }
+        if provider_config:
+            providers[provider] = provider_config
+    return {"providers": providers}
+
 
+def _provider_names(toml_data: TomlData) -> set[str]:
+    """Get the names of the known providers, and of the configured ones."""
+    names = set(DEFAULT_MODELS)
+    for table in [toml_data, *_tables(toml_data.get("profiles"))]:
+        if isinstance(provider := table.get("provider"), str):
+            names.add(provider)
+    providers = toml_data.get("providers")
+    if isinstance(providers, dict):
+        names.update(providers)
+    return names
 
-def get_provider() -> str:
+
+def _tables(value: object) -> list[TomlData]:
+    """Get the sub-tables of a TOML table, like the profiles."""
+    if not isinstance(value, dict):
+        return []
+    return [table for table in value.values() if isinstance(table, dict)]
+
+
+def _check_repo_config(repo_config: TomlData, repo_dir: Path) -> None:
+    """Raise ValueError if the repo-local config sets what your key is spent on."""
+    config_path = repo_dir / REPO_CONFIG_NAME
+    if any("api_key" in p for p in _tables(repo_config.get("providers"))):
+        raise ValueError(
+            f"Don't set an API key in '{config_path}'. "
+            f"Set it in '{config_file}' or in an environment variable."
+        )
+    tables = [
+        repo_config,
+        *_tables(repo_config.get("profiles")),
+        *_tables(repo_config.get("providers")),
+    ]
+    if any(key in table for table in tables for key in PROVIDER_ROUTING):
+        raise ValueError(
+            f"Don't set a provider or a model in '{config_path}'. "
+            f"Set it in '{config_file}' or in an environment variable."
+        )
+    for key in SPENDING_SETTINGS:
+        if any(key in table for table in tables):
+            raise ValueError(
+                f"Don't set '{key}' in '{config_path}'. "
+                f"Set it in '{config_file}', in an environment variable, "
+                "or with a CLI option."
+            )
+
+
+@functools.cache
+def load_config(repo_dir: Path | None = None) -> Config:
+    """Load and validate the configuration, with the repo-local config file.
+
+    Raise ValueError if the configuration is invalid.
+    """
+    load_dotenv()
+    repo_config = _read_toml(repo_dir / REPO_CONFIG_NAME) if repo_dir else {}
+    if repo_dir:
+        _check_repo_config(repo_config, repo_dir)
+    file_config = _merge(_read_toml(config_file), repo_config)
+    env_config = _merge(
+        _env_config(), _provider_env_config(_provider_names(file_config))
+    )
+    default_models: TomlData = {
+        provider: {"model": model} for provider, model in DEFAULT_MODELS.items()
+    }
+    merged = _merge(
+        {"profiles": BUILTIN_PROFILES, "providers": default_models}, env_config
+    )
+    merged = _merge(merged, file_config)
+    return Config.model_validate(merged)
+
+
+def get_settings(profile: str | None = None, repo_dir: Path | None = None) -> Settings:
+    """Get the settings, with the selected profile applied."""
+    loaded_config = load_config(repo_dir)
+    settings = Settings.model_validate(
+        loaded_config.model_dump(include=set(Settings.model_fields))
+    )
+    profile = profile or loaded_config.profile
+    if not profile:
+        return settings
+    if profile not in loaded_config.profiles:
+        raise ValueError(
+            f"Unknown profile '{profile}'. "
+            f"Use one of: {', '.join(loaded_config.profiles)}."
+        )
+    overrides = loaded_config.profiles[profile].model_dump(exclude_unset=True)
+    return settings.model_copy(update=overrides)
+
+
+def _get_provider_config(provider: str, repo_dir: Path | None) -> ProviderConfig:
+    return load_config(repo_dir).providers.get(provider, ProviderConfig())
+
+
+def get_provider(repo_dir: Path | None = None) -> str:
     """Get the configured provider."""
-    provider = _file_config.get("provider") or os.getenv("VIBES_PROVIDER")
+    provider = load_config(repo_dir).provider
     if not provider:
         raise ValueError(
             "No provider configured. "
@@ -56,14 +276,8 @@ def get_provider() -> str:
 def get_api_key(provider: str | None = None) -> str:
     """Get API key for the specified or current provider."""
     target_provider = provider or get_provider()
-
-    api_key = None
-
-    # Check file config
-    api_key = _file_config.get("providers", {}).get(target_provider, {}).get("api_key")
-    # Check environment
-    api_key = api_key or os.getenv(f"{target_provider.upper()}_API_KEY")
-
+    # a repo-local config can't set it
+    api_key = _get_provider_config(target_provider, None).api_key
     if not api_key:
         raise ValueError(
             f"No API key found for provider '{target_provider}'. "
@@ -73,25 +287,10 @@ def get_api_key(provider: str | None = None) -> str:
     return api_key
 
 
-def get_model(provider: str | None = None) -> str:
+def get_model(provider: str | None = None, repo_dir: Path | None = None) -> str:
     """Get model for the specified or current provider."""
-    target_provider = provider or get_provider()
-
-    defaults = {
-        "openai": "gpt-5",
-        "anthropic": "claude-sonnet-4-5",
-        "google": "gemini-3-pro",
-    }
-
-    model = None
-
-    # Check file config
-    model = _file_config.get("providers", {}).get(target_provider, {}).get("model")
-    # Check environment
-    model = model or os.getenv(f"{target_provider.upper()}_MODEL")
-    # Check defaults
-    model = model or defaults.get(target_provider)
-
+    target_provider = provider or get_provider(repo_dir)
+    model = _get_provider_config(target_provider, repo_dir).model
     if not model:
         raise ValueError(
             f"No model found for provider '{target_provider}'. "
@@ -99,3 +298,11 @@ def get_model(provider: str | None = None) -> str:
             f"or {target_provider.upper()}_MODEL environment variable."
         )
     return model
+
+
+def get_output_mode(
+    provider: str | None = None, repo_dir: Path | None = None
+) -> OutputMode:
+    """Get the structured output mode for the specified or current provider."""
+    target_provider = provider or get_provider(repo_dir)
+    return _get_provider_config(target_provider, repo_dir).output_mode
@@ -0,0 +1,246 @@
+"""Render a compact diff, that adapts to each file.
+
+The plain diff shows every file with 3 lines of context. Here, each file gets
+the context its hunks need, prose files are diffed by words, renames and copies
+are detected, and a hunk that is repeated in several files is shown once.
+"""
+
+import itertools
+import math
+import re
+import statistics
+from collections import defaultdict
+from pathlib import PurePosixPath
+
+import git
+
+DEFAULT_CONTEXT = 3
+# a file with more hunks gets less context
+FEW_HUNKS = 3
+# hunks that are closer than this (in lines) are dense, and get no context
+DENSE_HUNK_GAP = 4
+WORD_DIFF_SUFFIXES = (".md", ".markdown", ".rst", ".txt")
+RENAME_LIMIT = 1000
+CHARS_PER_TOKEN = 4
+
+HUNK_HEADER_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+_C_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13}
+
+
+def unquote_path(path: str) -> str:
+    r"""Unquote a path that git quoted, like `"sp ace \303\274.txt"`."""
+    if not (len(path) > 1 and path[0] == path[-1] == '"'):
+        return path
+    raw = bytearray()
+    quoted = path[1:-1]
+    i = 0
+    while i < len(quoted):
+        if quoted[i] != "\\":
+            raw += quoted[i].encode()
+            i += 1
+        elif quoted[i + 1].isdigit():
+            # an octal escape of a byte, of a non-ASCII char
+            raw.append(int(quoted[i + 1 : i + 4], 8))
+            i += 4
+        else:
+            escape = quoted[i + 1]
+            raw += (
+                bytes([_C_ESCAPES[escape]]) if escape in _C_ESCAPES else escape.encode()
+            )
+            i += 2
+    return raw.decode("utf-8", errors="replace")
+
+
+def _header_path(sides: str) -> str:
+    """Get the new path from the `a/<old> b/<new>` of a `diff --git` line."""
+    if sides.endswith('"'):
+        new_side = sides[sides.rindex(' "b/') + 1 :]
+    else:
+        # both sides have the same length, unless the file was renamed
+        new_side = sides[len(sides) // 2 + 1 :]
+    return unquote_path(new_side).split("/", 1)[-1]
+
+
+def split_diff(git_diff: str) -> dict[str, str]:
+    """Split a git diff to the diff of each file, keyed by the file path."""
+    file_diffs: dict[str, list[str]] = {}
+    lines: list[str] = []
+    path = ""
+    in_header = False
+    for line in git_diff.splitlines():
+        if line.startswith("diff --git "):
+            path = _header_path(line.removeprefix("diff --git "))
+            lines = file_diffs[path] = []
+            in_header = True
+        elif line.startswith("@@"):
+            in_header = False
+        elif in_header and line.startswith(("rename to ", "+++ ")):
+            # the header has the reliable new path, so re-key the file
+            if line.startswith("rename to "):
+                new_path = unquote_path(line.removeprefix("rename to "))
+            else:
+                # git adds a tab after a path with a space
+                new_side = unquote_path(line.removeprefix("+++ ").removesuffix("\t"))
+                new_path = new_side.split("/", 1)[-1]
+            if line != "+++ /dev/null" and new_path != path:
+                file_diffs[new_path] = file_diffs.pop(path)
+                path = new_path
+        lines.append(line)
+    return {path: "\n".join(lines) for path, lines in file_diffs.items()}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text, without a tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_savings(plain_tokens: int, tokens: int) -> str:
+    """Describe the tokens saved by the adaptive diff."""
+    saved = 1 - tokens / plain_tokens if plain_tokens else 0
+    return (
+        f"Adaptive diff: ~{tokens} tokens instead of ~{plain_tokens} "
+        f"({saved:.0%} saved)"
+    )
+
+
+def limit_diff(git_diff: str, max_tokens: int) -> str:
+    """Limit a diff to a token budget, by omitting the files that don't fit.
+
+    The omitted files are listed before the diff, so `split_diff` doesn't take
+    the list as a part of a file.
+    """
+    if estimate_tokens(git_diff) <= max_tokens:
+        return git_diff
+    budget = max_tokens
+    kept: list[str] = []
+    omitted: list[str] = []
+    for path, file_diff in split_diff(git_diff).items():
+        tokens = estimate_tokens(f"{file_diff}\n")
+        if tokens <= budget:
+            kept.append(file_diff)
+            budget -= tokens
+        else:
+            omitted.append(path)
+    note = f"# {len(omitted)} more files are omitted: {', '.join(omitted)}"
+    return "\n".join([note, *kept])
+
+
+def parse_hunks(file_diff: str) -> list[tuple[int, int]]:
+    """Get the start and length of each hunk of a file, in the new file."""
+    hunks = []
+    for line in file_diff.splitlines():
+        if match := HUNK_HEADER_RE.match(line):
+            start, length = match.groups()
+            hunks.append((int(start), int(length or 1)))
+    return hunks
+
+
+def choose_context(hunks: list[tuple[int, int]]) -> int:
+    """Choose the lines of context of a file, by the density of its hunks.
+
+    A file with a few hunks gets the default context, to show where it changed.
+    With more hunks, the hunks show enough of the file, so the context is cut
+    to a single line, or to none when the hunks are dense.
+    """
+    if len(hunks) <= FEW_HUNKS:
+        return DEFAULT_CONTEXT
+    gaps = [
+        start - (prev_start + prev_length)
+        for (prev_start, prev_length), (start, _length) in itertools.pairwise(hunks)
+    ]
+    return 0 if statistics.median(gaps) < DENSE_HUNK_GAP else 1
+
+
+def _source_path(file_diff: str) -> str | None:
+    """Get the source path of a renamed or copied file."""
+    for line in file_diff.splitlines():
+        if line.startswith("@@"):
+            break
+        if line.startswith(("rename from ", "copy from ")):
+            return unquote_path(line.split(" from ", 1)[1])
+    return None
+
+
+def _git_diff(repo: git.Repo, diff_args: list[str], *options: str) -> str:
+    output: str = repo.git.execute(
+        [
+            *("git", "--literal-pathspecs", "diff", "--no-color", "--no-ext-diff"),
+            *("-M", "-C", f"-l{RENAME_LIMIT}", *options, *diff_args),
+        ]
+    )
+    return output
+
+
+def collapse_repeated_hunks(file_diffs: dict[str, str]) -> dict[str, str]:
+    """Show a hunk that is repeated in several files only once, with the files."""
+    split_files: dict[str, tuple[list[str], list[str]]] = {}
+    paths_by_body: defaultdict[str, list[str]] = defaultdict(list)
+    for path, file_diff in file_diffs.items():
+        header, hunks = _split_hunks(file_diff)
+        split_files[path] = header, hunks
+        for hunk in hunks:
+            body = hunk.partition("\n")[2]
+            if path not in paths_by_body[body]:
+                paths_by_body[body].append(path)
+
+    collapsed = {}
+    shown: set[str] = set()
+    for path, (header, hunks) in split_files.items():
+        lines = header.copy()
+        for hunk in hunks:
+            body = hunk.partition("\n")[2]
+            paths = paths_by_body[body]
+            if len(paths) == 1:
+                lines.append(hunk)
+            elif body not in shown:
+                shown.add(body)
+                lines.append(hunk)
+                lines.append(f"# the same hunk is also in: {', '.join(paths[1:])}")
+        collapsed[path] = "\n".join(lines)
+    return collapsed
+
+
+def _split_hunks(file_diff: str) -> tuple[list[str], list[str]]:
+    """Split the diff of a file to its header lines, and its hunks."""
+    header: list[str] = []
+    hunks: list[str] = []
+    for line in file_diff.splitlines():
+        if line.startswith("@@"):
+            hunks.append(line)
+        elif hunks:
+            hunks[-1] += f"\n{line}"
+        else:
+            header.append(line)
+    return header, hunks
+
+
+def render_adaptive_diff(repo: git.Repo, diff_args: list[str]) -> str:
+    """Render the diff of `git diff <diff_args>`, adapted to each file.
+
+    The files are planned from a diff without context, and then the files with
+    the same options are diffed together, so git runs only a few times.
+    """
+    planned = split_diff(_git_diff(repo, diff_args, "-U0"))
+    groups: defaultdict[tuple[int, bool], list[str]] = defaultdict(list)
+    for path, file_diff in planned.items():
+        context = choose_context(parse_hunks(file_diff))
+        word_diff = PurePosixPath(path).suffix.lower() in WORD_DIFF_SUFFIXES
+        groups[context, word_diff].append(path)
+
+    rendered: dict[str, str] = {}
+    for (context, word_diff), paths in groups.items():
+        # the source of a rename or copy is needed to detect it
+        sources = [_source_path(planned[path]) for path in paths]
+        pathspec = [*paths, *(source for source in sources if source)]
+        options = [f"-U{context}", *(["--word-diff=plain"] if word_diff else [])]
+        group_diffs = split_diff(
+            _git_diff(repo, [*diff_args, "--", *pathspec], *options)
+        )
+        # fall back to no context, if git paired the files differently
+        rendered.update((path, group_diffs.get(path, planned[path])) for path in paths)
+
+    # keep the order of git
+    ordered = {path: rendered[path] for path in planned}
+    return "\n".join(collapse_repeated_hunks(ordered).values())
@@ -0,0 +1,256 @@
+"""Index the messages of past commits, to use similar ones as examples.
+
+The index is kept in a SQLite DB per repo, under the cache dir. It remembers
+the tips it indexed, and is updated incrementally with the commits of HEAD that
+aren't in their history, using a single `git log` stream. So switching branches
+or rebasing only indexes the new commits.
+Similar commits are found by the paths they touched: a commit scores
+`FILE_WEIGHT` for each touched file it shares, and `DIR_WEIGHT` for each
+directory of a touched file it shares. Only the newest `POSTINGS_LIMIT`
+commits of each path, and only `MAX_QUERY_PATHS` paths of the diff, are
+scored, so retrieval stays fast on long histories.
+"""
+
+import hashlib
+import sqlite3
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+import git
+
+from vibes import config
+from vibes.prompt import split_header
+
+FILE_WEIGHT = 3
+DIR_WEIGHT = 1
+POSTINGS_LIMIT = 200
+MAX_QUERY_PATHS = 32
+MAX_EXAMPLE_LENGTH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY, sha TEXT, header TEXT, emoji TEXT, scope TEXT,
+    message TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS commits_sha ON commits (sha);
+CREATE TABLE IF NOT EXISTS tips (sha TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS paths (token TEXT, weight INTEGER, commit_id INTEGER);
+CREATE INDEX IF NOT EXISTS paths_token ON paths (token, commit_id, weight);
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class PastCommit:
+    """A past commit, as indexed."""
+
+    sha: str
+    header: str
+    emoji: str
+    scope: str
+    message: str
+    paths: tuple[str, ...]
+
+
+def _path_tokens(path: str) -> list[tuple[str, int]]:
+    """Get the index tokens of a path: the path itself, and its directory."""
+    tokens = [(path, FILE_WEIGHT)]
+    parent = PurePosixPath(path).parent
+    if parent != PurePosixPath():
+        tokens.append((f"{parent}/", DIR_WEIGHT))
+    return tokens
+
+
+def iter_past_commits(repo: git.Repo, *revs: str) -> Iterator[PastCommit]:
+    """Yield the non-merge commits of `git log revs`, newest first, with their paths."""
+    proc = repo.git.execute(
+        [
+            *("git", "-c", "core.quotePath=false", "log", "--no-merges"),
+            # rename detection would fetch each blob of a partial clone lazily
+            *("--name-only", "--no-renames", "--format=%x1e%H%x1f%B%x1f"),
+            *(*revs, "--"),
+        ],
+        as_process=True,
+    )
+    assert proc.proc is not None  # noqa: S101
+    stdout = proc.proc.stdout
+    assert stdout is not None  # noqa: S101
+    record = b""
+    for line in stdout:
+        if line.startswith(b"\x1e") and record:
+            yield _parse_record(record)
+            record = b""
+        record += line
+    if record:
+        yield _parse_record(record)
+    proc.wait()
+
+
+def _parse_record(record: bytes) -> PastCommit:
+    sha, message, paths = record.decode("utf-8", errors="replace")[1:].split("\x1f")
+    message = message.strip()
+    header = message.split("\n", 1)[0]
+    emoji, scope, _description = split_header(header)
+    return PastCommit(
+        sha=sha,
+        header=header,
+        emoji=emoji,
+        scope=scope,
+        message=message,
+        paths=tuple(path for path in paths.splitlines() if path),
+    )
+
+
+def _has_commit(repo: git.Repo, sha: str) -> bool:
+    try:
+        repo.git.rev_parse("--verify", "--quiet", f"{sha}^{{commit}}")
+    except git.exc.GitCommandError:
+        return False
+    return True
+
+
+class HistoryIndex:
+    """An on-disk index of the past commits of a repo."""
+
+    def __init__(self, path: Path) -> None:
+        """Open (or create) the index at `path`."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the index."""
+        self.connection.close()
+
+    @property
+    def tips(self) -> list[str]:
+        """The indexed tips, whose whole history is indexed."""
+        return [sha for (sha,) in self.connection.execute("SELECT sha FROM tips")] or [
+            # an index from before the tips were kept
+            sha
+            for (sha,) in self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'last_sha'"
+            )
+        ]
+
+    def update(self, repo: git.Repo) -> int:
+        """Index the commits of HEAD that aren't indexed yet, and return their number.
+
+        Only the commits that aren't in the history of an indexed tip are read,
+        so after a rebase or a branch switch, the index isn't rebuilt.
+        """
+        if not repo.head.is_valid():
+            return 0
+        head = repo.head.commit.hexsha
+        # a tip may be gone, e.g. after a rebase and a gc
+        tips = [tip for tip in self.tips if _has_commit(repo, tip)]
+        if head in tips:
+            return 0
+        past_commits = list(iter_past_commits(repo, head, "--not", *tips))
+        # keep only the tips that aren't in the history of another one
+        new_tips = repo.git.merge_base("--independent", head, *tips).split()
+        with self.connection:
+            count = self._insert(reversed(past_commits))
+            self.connection.execute("DELETE FROM tips")
+            self.connection.executemany(
+                "INSERT INTO tips VALUES (?)", [(tip,) for tip in new_tips]
+            )
+        return count
+
+    def _insert(self, past_commits: Iterable[PastCommit]) -> int:
+        count = 0
+        for past_commit in past_commits:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO commits (sha, header, emoji, scope, message) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    past_commit.sha,
+                    past_commit.header,
+                    past_commit.emoji,
+                    past_commit.scope,
+                    past_commit.message,
+                ),
+            )
+            if not cursor.rowcount:
+                # already indexed from another tip
+                continue
+            tokens = {
+                token: weight
+                for path in past_commit.paths
+                for token, weight in _path_tokens(path)
+            }
+            self.connection.executemany(
+                "INSERT INTO paths VALUES (?, ?, ?)",
+                [(token, weight, cursor.lastrowid) for token, weight in tokens.items()],
+            )
+            count += 1
+        return count
+
+    def similar(
+        self, paths: Iterable[str], k: int, exclude: Iterable[str] = ()
+    ) -> list[PastCommit]:
+        """Get the `k` past commits that share the most paths, newest first on ties."""
+        paths = list(paths)[:MAX_QUERY_PATHS]
+        tokens = {token for path in paths for token, _weight in _path_tokens(path)}
+        exclude = list(exclude)
+        if not tokens or k <= 0:
+            return []
+        # only the newest commits of each token are scored, to bound the query time
+        postings = " UNION ALL ".join(
+            "SELECT * FROM (SELECT commit_id, weight FROM paths WHERE token = ? "
+            "ORDER BY commit_id DESC LIMIT ?)"
+            for _token in tokens
+        )
+        rows = self.connection.execute(
+            f"""
+            SELECT c.sha, c.header, c.emoji, c.scope, c.message
+            FROM (
+                SELECT commit_id, SUM(weight) AS score FROM ({postings})
+                GROUP BY commit_id
+            ) AS s JOIN commits AS c ON c.id = s.commit_id
+            WHERE c.sha NOT IN ({", ".join("?" * len(exclude))})
+            ORDER BY s.score DESC, c.id DESC
+            LIMIT ?
+            """,  # noqa: S608
+            [
+                *(arg for token in tokens for arg in (token, POSTINGS_LIMIT)),
+                *exclude,
+                k,
+            ],
+        ).fetchall()
+        return [
+            PastCommit(
+                sha=sha,
+                header=header,
+                emoji=emoji,
+                scope=scope,
+                message=message,
+                paths=(),
+            )
+            for sha, header, emoji, scope, message in rows
+        ]
+
+
+def get_index_path(repo: git.Repo) -> Path:
+    """Get the path of the history index of a repo."""
+    repo_dir = Path(repo.common_dir).resolve()
+    key = hashlib.sha256(str(repo_dir).encode()).hexdigest()[:32]
+    return config.cache_dir / "history" / f"{key}.sqlite"
+
+
+def get_examples(
+    repo: git.Repo, paths: Iterable[str], k: int, exclude: Iterable[str] = ()
+) -> str:
+    """Get the messages of the `k` most similar past commits, as prompt examples."""
+    if k <= 0:
+        return ""
+    index = HistoryIndex(get_index_path(repo))
+    try:
+        index.update(repo)
+        past_commits = index.similar(paths, k, exclude)
+    finally:
+        index.close()
+    return "\n\n".join(
+        past_commit.message[:MAX_EXAMPLE_LENGTH] for past_commit in past_commits
+    )
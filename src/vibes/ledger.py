@@ -0,0 +1,236 @@
+"""Record the usage of each LLM request in a local SQLite ledger.
+
+The requests are recorded by wrapping the model, and written to the ledger in
+batches by a background thread, so recording never waits for the disk.
+"""
+
+import queue
+import sqlite3
+import statistics
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import astuple, dataclass, fields
+from pathlib import Path
+from types import TracebackType
+from typing import Self, override
+
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.models import Model, ModelRequestParameters
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.settings import ModelSettings
+
+from vibes import config
+
+# one id per process, to group the requests made for a single commit
+RUN_ID = uuid.uuid4().hex
+DIFF_SIZE_BUCKETS = [(1_000, "<1k"), (10_000, "1k-10k"), (100_000, "10k-100k")]
+
+
+def get_ledger_path() -> Path:
+    """Get the path of the ledger DB."""
+    return config.cache_dir / "ledger.sqlite"
+
+
+def diff_size_bucket(diff_size: int) -> str:
+    """Get the bucket of a diff size, in chars."""
+    for limit, bucket in DIFF_SIZE_BUCKETS:
+        if diff_size < limit:
+            return bucket
+    return ">100k"
+
+
+@dataclass(frozen=True, slots=True)
+class UsageContext:
+    """What a request is about, for the ledger."""
+
+    repo: str = ""
+    diff_size: str = ""
+
+
+usage_context: ContextVar[UsageContext] = ContextVar(
+    "usage_context", default=UsageContext()  # noqa: B039 (it is frozen)
+)
+
+
+@dataclass(frozen=True, slots=True)
+class UsageRecord:
+    """The usage of a single LLM request."""
+
+    timestamp: float
+    run_id: str
+    provider: str
+    model: str
+    prompt_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    latency: float
+    repo: str
+    diff_size: str
+
+
+_COLUMNS = [field.name for field in fields(UsageRecord)]
+_CREATE_TABLE = f"CREATE TABLE IF NOT EXISTS usage ({', '.join(_COLUMNS)})"
+_INSERT = (
+    f"INSERT INTO usage ({', '.join(_COLUMNS)}) "  # noqa: S608
+    f"VALUES ({', '.join('?' * len(_COLUMNS))})"
+)
+
+
+class Ledger:
+    """A usage ledger, written in batches by a background thread.
+
+    Use it as a context manager, to flush the pending records on exit.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Open the ledger at `path`."""
+        self.path = path
+        self._queue: queue.SimpleQueue[UsageRecord | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def record(self, usage_record: UsageRecord) -> None:
+        """Queue a record to be written."""
+        self._queue.put(usage_record)
+
+    def close(self) -> None:
+        """Write all the pending records, and stop the writer."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> Self:
+        """Return the ledger."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        """Close the ledger."""
+        self.close()
+
+    def _write(self) -> None:
+        connection: sqlite3.Connection | None = None
+        closed = False
+        while not closed:
+            batch = [self._queue.get()]
+            # take everything that is already waiting
+            while not self._queue.empty():
+                batch.append(self._queue.get())
+            closed = None in batch
+            records = [astuple(r) for r in batch if r is not None]
+            if not records:
+                continue
+            try:
+                if connection is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    connection = sqlite3.connect(self.path)
+                    connection.execute(_CREATE_TABLE)
+                with connection:
+                    connection.executemany(_INSERT, records)
+            except (OSError, sqlite3.Error):
+                # the ledger is best-effort, and should never fail a run
+                continue
+        if connection is not None:
+            connection.close()
+
+
+class LedgerModel(WrapperModel):
+    """A model that records the usage of each request in a ledger.
+
+    Streamed requests are not recorded, since vibes doesn't stream.
+    """
+
+    def __init__(self, wrapped: Model[object], ledger: Ledger, provider: str) -> None:
+        """Wrap a model, to record its usage in the ledger."""
+        super().__init__(wrapped)
+        self.ledger = ledger
+        self.provider_name = provider
+
+    @override
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        """Make a request, and record its usage."""
+        start = time.perf_counter()
+        response = await super().request(
+            messages, model_settings, model_request_parameters
+        )
+        latency = time.perf_counter() - start
+        context = usage_context.get()
+        self.ledger.record(
+            UsageRecord(
+                timestamp=time.time(),
+                run_id=RUN_ID,
+                provider=self.provider_name,
+                model=response.model_name or self.model_name,
+                prompt_tokens=response.usage.input_tokens,
+                cached_tokens=response.usage.cache_read_tokens,
+                output_tokens=response.usage.output_tokens,
+                latency=latency,
+                repo=context.repo,
+                diff_size=context.diff_size,
+            )
+        )
+        return response
+
+
+@dataclass(frozen=True, slots=True)
+class ModelStats:
+    """Latency and token statistics of a model."""
+
+    model: str
+    requests: int
+    latency_p50: float
+    latency_p95: float
+    tokens_per_commit: float
+    cache_hit_rate: float
+
+
+def _percentile(values: list[float], percent: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def get_stats(path: Path, since: float = 0) -> list[ModelStats]:
+    """Get the statistics of each model in the ledger, since a timestamp."""
+    if not path.exists():
+        return []
+    with sqlite3.connect(path) as connection:
+        connection.execute(_CREATE_TABLE)
+        rows = connection.execute(
+            "SELECT model, latency, prompt_tokens, "
+            "cached_tokens, output_tokens, run_id, repo "
+            "FROM usage WHERE timestamp >= ? ORDER BY model",
+            (since,),
+        ).fetchall()
+    connection.close()
+    by_model: dict[str, list[tuple[float, int, int, int, str, str]]] = {}
+    for row in rows:
+        by_model.setdefault(row[0], []).append(row[1:])
+    stats = []
+    for model, requests in by_model.items():
+        latencies = [r[0] for r in requests]
+        prompt_tokens = sum(r[1] for r in requests)
+        cached_tokens = sum(r[2] for r in requests)
+        total_tokens = prompt_tokens + sum(r[3] for r in requests)
+        commits = len({(r[4], r[5]) for r in requests})
+        stats.append(
+            ModelStats(
+                model=model,
+                requests=len(requests),
+                latency_p50=_percentile(latencies, 50),
+                latency_p95=_percentile(latencies, 95),
+                tokens_per_commit=total_tokens / commits,
+                cache_hit_rate=cached_tokens / prompt_tokens if prompt_tokens else 0,
+            )
+        )
+    return stats
@@ -0,0 +1,218 @@
+"""Talk to the configured LLM."""
+
+import dataclasses
+import json
+import os
+import re
+from pathlib import Path
+from typing import override
+
+from pydantic import BaseModel
+from pydantic_ai import Agent, NativeOutput, PromptedOutput, ToolOutput
+from pydantic_ai.agent import AgentRunResult
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelResponse,
+    ModelResponsePart,
+    TextPart,
+    ToolCallPart,
+)
+from pydantic_ai.models import Model, ModelRequestParameters, infer_model
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.output import OutputSpec
+from pydantic_ai.settings import ModelSettings
+
+from vibes import config
+from vibes.ledger import Ledger, LedgerModel
+
+CODE_FENCE_RE = re.compile(r"^\s*```[\w-]*\s*\n(.*?)\n?```\s*$", re.DOTALL)
+
+
+class CommitMessageResponse(BaseModel):
+    """Structured response for commit message generation."""
+
+    message: str
+    emoji_legend: dict[str, str]
+
+
+def get_output_type(mode: str = "tool") -> OutputSpec[CommitMessageResponse]:
+    """Get the output type of a commit message, in a structured output mode.
+
+    "native" uses the JSON schema support of the model, "tool" asks for a tool
+    call, and "prompted" describes the schema in the prompt.
+    """
+    output_types: dict[str, OutputSpec[CommitMessageResponse]] = {
+        "native": NativeOutput(CommitMessageResponse),
+        "tool": ToolOutput(CommitMessageResponse),
+        "prompted": PromptedOutput(CommitMessageResponse),
+    }
+    return output_types[mode]
+
+
+def _coerce_emoji_legend(output: object) -> object:
+    """Convert an emoji legend given as a list to a dict."""
+    if not isinstance(output, dict) or not isinstance(output.get("emoji_legend"), list):
+        return output
+    emoji_legend: dict[str, str] = {}
+    for item in output["emoji_legend"]:
+        if isinstance(item, dict) and len(item) == 1:
+            # a dict with the emoji as its key
+            ((emoji, meaning),) = item.items()
+        elif isinstance(item, dict) and len(item) == 2:  # noqa: PLR2004
+            # a dict with the emoji and the meaning as its values
+            emoji, meaning = item.values()
+        elif isinstance(item, list) and len(item) == 2:  # noqa: PLR2004
+            # a pair of the emoji and the meaning
+            emoji, meaning = item
+        elif isinstance(item, str) and ":" in item:
+            # a string like "emoji: meaning"
+            emoji, meaning = item.split(":", 1)
+        else:
+            return output
+        emoji_legend[str(emoji).strip()] = str(meaning).strip()
+    return {**output, "emoji_legend": emoji_legend}
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """Remove the commas before a closing bracket, outside of the strings."""
+    chars: list[str] = []
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if escaped:
+            escaped = False
+        elif in_string:
+            escaped = char == "\\"
+            in_string = char != '"'
+        elif char == '"':
+            in_string = True
+        elif char == "," and text[i + 1 :].lstrip()[:1] in ("}", "]"):
+            continue
+        chars.append(char)
+    return "".join(chars)
+
+
+def repair_json(text: str) -> str:
+    """Repair common mistakes in a JSON output, or return it as is.
+
+    Strip a code fence, remove trailing commas, and convert an emoji legend
+    given as a list to a dict.
+    """
+    repaired = text
+    if match := CODE_FENCE_RE.match(repaired):
+        repaired = match.group(1)
+    try:
+        output = json.loads(repaired)
+    except json.JSONDecodeError:
+        try:
+            output = json.loads(_remove_trailing_commas(repaired))
+        except json.JSONDecodeError:
+            # let the model retry
+            return text
+    return json.dumps(_coerce_emoji_legend(output), ensure_ascii=False)
+
+
+class RepairModel(WrapperModel):
+    """A model that repairs its structured output locally.
+
+    A malformed output makes the agent retry, sending the whole chat again, so
+    common mistakes are fixed before the output is validated.
+    """
+
+    @override
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        """Make a request, and repair its structured output."""
+        response = await super().request(
+            messages, model_settings, model_request_parameters
+        )
+        parts = [
+            self._repair(part, model_request_parameters) for part in response.parts
+        ]
+        return dataclasses.replace(response, parts=parts)
+
+    @staticmethod
+    def _repair(
+        part: ModelResponsePart, params: ModelRequestParameters
+    ) -> ModelResponsePart:
+        output_tool_names = {tool.name for tool in params.output_tools}
+        if isinstance(part, TextPart) and params.output_mode in ("native", "prompted"):
+            return dataclasses.replace(part, content=repair_json(part.content))
+        if isinstance(part, ToolCallPart) and part.tool_name in output_tool_names:
+            if isinstance(part.args, str):
+                return dataclasses.replace(part, args=repair_json(part.args))
+            if isinstance(part.args, dict):
+                args = _coerce_emoji_legend(part.args)
+                assert isinstance(args, dict)  # noqa: S101
+                return dataclasses.replace(part, args=args)
+        return part
+
+
+def get_agent(
+    ledger: Ledger | None = None,
+    settings: config.Settings | None = None,
+    repo_dir: Path | None = None,
+) -> Agent[None, CommitMessageResponse]:
+    """Create an agent for the configured provider and model.
+
+    The agent outputs a commit message, in the configured output mode. The
+    settings can route to another provider or model, and set a timeout. If a
+    ledger is given, the usage of each request is recorded in it.
+    """
+    settings = settings or config.get_settings(repo_dir=repo_dir)
+    provider = settings.provider or config.get_provider(repo_dir)
+
+    # Set API key in environment (automatically cleaned up when process exits)
+    env_var = f"{provider.upper()}_API_KEY"
+    os.environ[env_var] = config.get_api_key(provider)
+
+    # Create agent using provider:model string format
+    model_name = settings.model or config.get_model(provider, repo_dir)
+    model_string = f"{provider}:{model_name}"
+    model: Model[object] = RepairModel(infer_model(model_string))
+    if ledger is not None:
+        model = LedgerModel(model, ledger, provider)
+    return Agent(
+        model,
+        output_type=get_output_type(config.get_output_mode(provider, repo_dir)),
+        model_settings=(
+            ModelSettings(timeout=settings.timeout) if settings.timeout else None
+        ),
+    )
+
+
+def describe_agent(agent: Agent[None, CommitMessageResponse]) -> list[str]:
+    """Describe the settings of an agent that change its output.
+
+    That is the provider, the model, the output mode and the timeout.
+    """
+    model = agent.model
+    model_name = (
+        f"{model.system}:{model.model_name}" if isinstance(model, Model) else str(model)
+    )
+    model_settings = agent.model_settings
+    timeout = (
+        None
+        if model_settings is None or callable(model_settings)
+        else model_settings.get("timeout")
+    )
+    return [model_name, type(agent.output_type).__name__, f"timeout={timeout}"]
+
+
+def count_retries(result: AgentRunResult[object]) -> int:
+    """Count the requests of a run that were retries."""
+    responses = [m for m in result.new_messages() if isinstance(m, ModelResponse)]
+    return max(len(responses) - 1, 0)
+
+
+def format_response(response: CommitMessageResponse) -> str:
+    """Format a commit message response, with its emoji legend."""
+    lines = [response.message, "", "", "Emoji Legend:"]
+    lines.extend(
+        f"{emoji}: {meaning}" for emoji, meaning in response.emoji_legend.items()
+    )
+    return "\n".join(lines)
@@ -1,12 +1,27 @@
 """Create a commit message prompt based on the current git state."""
 
+import re
+import stat
+import subprocess
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
 import git
 
-from vibes.resources import message_style_emoji_md, prompt_md
+from vibes.diff import estimate_tokens, limit_diff, render_adaptive_diff
+from vibes.resources import delta_prompt_md, message_style_emoji_md, prompt_md
 
 MESSAGE_FORMAT = prompt_md.read_text(encoding="utf-8")
+DELTA_FORMAT = delta_prompt_md.read_text(encoding="utf-8")
 MESSAGE_STYLE = message_style_emoji_md.read_text(encoding="utf-8")
 
+# limits for including untracked files in the diff
+BINARY_SNIFF_BYTES = 8000  # same as git
+UNTRACKED_FILE_MAX_BYTES = 32 * 1024
+UNTRACKED_TOTAL_MAX_BYTES = 128 * 1024
+README_PATHS = ["README.md", "README.MD", "Readme.md", "readme.md"]
+
 
 def list_files_in_commit(commit: git.Commit) -> list[str]:
     """List all the files in a repo at a given commit.
@@ -51,15 +66,221 @@ def split_commit_range(repo: git.Repo, commit_range: str) -> tuple[str, str]:
     return commit_start, commit_end
 
 
-def get_repo_info(repo: git.Repo, commit_range: str) -> dict[str, str]:
-    """Get git information for a specific commit."""
+def list_untracked_files(repo: git.Repo) -> list[str]:
+    """List the untracked files that are not ignored."""
+    output = repo.git.ls_files("--others", "--exclude-standard", "-z")
+    return [path for path in output.split("\0") if path]
+
+
+def _new_file_hunk(content: bytes, max_bytes: int, file_size: int) -> list[str]:
+    """Get the hunk of a new text file, from the first bytes of its content."""
+    truncated = len(content) > max_bytes
+    lines = content[:max_bytes].decode("utf-8", errors="replace").splitlines()
+    if truncated and len(lines) > 1:
+        # drop the partial last line, unless no whole line fits
+        lines = lines[:-1]
+    if not lines:
+        return []
+    hunk = [f"@@ -0,0 +1{f',{len(lines)}' if len(lines) > 1 else ''} @@"]
+    hunk += [f"+{line}" for line in lines]
+    if truncated:
+        hunk.append(f"\\ File truncated, it has {file_size} bytes")
+    elif not content.endswith(b"\n"):
+        hunk.append("\\ No newline at end of file")
+    return hunk
+
+
+def limit_untracked_paths(
+    untracked_files: list[str], max_total_bytes: int = UNTRACKED_TOTAL_MAX_BYTES
+) -> list[str]:
+    """Get the untracked paths that fit in a size limit, and a note on the rest."""
+    budget = max_total_bytes
+    for i, file_path in enumerate(untracked_files):
+        budget -= len(file_path) + 1
+        if budget < 0:
+            omitted = len(untracked_files) - i
+            return [*untracked_files[:i], f"# {omitted} more untracked files"]
+    return untracked_files
+
+
+def iter_untracked_diff(
+    repo: git.Repo,
+    untracked_files: list[str],
+    max_file_bytes: int = UNTRACKED_FILE_MAX_BYTES,
+    max_total_bytes: int = UNTRACKED_TOTAL_MAX_BYTES,
+) -> Iterator[str]:
+    """Yield the lines of a synthetic "new file" diff of the untracked files.
+
+    Binary files are detected by sniffing their first few KB, and their content
+    is omitted. Each file, and all the files together, are limited in size, so
+    large untracked files are never read as a whole.
+    """
+    assert repo.working_tree_dir is not None  # noqa: S101
+    working_tree = Path(repo.working_tree_dir)
+    budget = max_total_bytes
+    for i, file_path in enumerate(untracked_files):
+        if budget <= 0:
+            yield f"# {len(untracked_files) - i} more untracked files are omitted"
+            return
+        path = working_tree / file_path
+        try:
+            mode = path.lstat().st_mode
+        except FileNotFoundError:
+            continue
+        header = [f"diff --git a/{file_path} b/{file_path}"]
+        if stat.S_ISLNK(mode):
+            header += ["new file mode 120000", "--- /dev/null", f"+++ b/{file_path}"]
+            lines = ["@@ -0,0 +1 @@", f"+{path.readlink()}"]
+            lines.append("\\ No newline at end of file")
+        elif stat.S_ISREG(mode):
+            file_mode = "100755" if mode & stat.S_IXUSR else "100644"
+            header.append(f"new file mode {file_mode}")
+            max_bytes = min(max_file_bytes, budget)
+            with path.open("rb") as f:
+                content = f.read(BINARY_SNIFF_BYTES)
+                is_binary = b"\0" in content
+                if not is_binary and len(content) <= max_bytes:
+                    content += f.read(max_bytes + 1 - len(content))
+            if is_binary:
+                lines = [f"Binary files /dev/null and b/{file_path} differ"]
+            else:
+                header += ["--- /dev/null", f"+++ b/{file_path}"]
+                lines = _new_file_hunk(content, max_bytes, path.stat().st_size)
+        else:
+            continue
+        for line in header + lines:
+            budget -= len(line) + 1
+            yield line
+
+
+def get_promisor_remote(repo: git.Repo) -> str | None:
+    """Get the remote that provides the missing objects of a partial clone."""
+    try:
+        output: str = repo.git.config(
+            "--type=bool", "--get-regexp", r"^remote\..*\.promisor$"
+        )
+    except git.exc.GitCommandError:
+        # no remote is a promisor
+        return None
+    for line in output.splitlines():
+        key, _, value = line.rpartition(" ")
+        if value == "true":
+            return key.removeprefix("remote.").removesuffix(".promisor")
+    return None
+
+
+def _git_with_input(repo: git.Repo, args: list[str], stdin: str) -> str:
+    proc = repo.git.execute(["git", *args], as_process=True, istream=subprocess.PIPE)
+    assert proc.proc is not None  # noqa: S101
+    stdout: bytes
+    stdout, _stderr = proc.proc.communicate(stdin.encode())
+    proc.wait()
+    return stdout.decode()
+
+
+def prefetch_blobs(
+    repo: git.Repo, commit_start: str, commit_end: str, paths: Iterable[str]
+) -> int:
+    """Fetch the missing blobs of the paths at both commits, in a single batch.
+
+    A partial clone fetches each missing blob lazily, in its own round trip, so
+    a large diff would take a fetch per file. Return the number of fetched blobs.
+    If the batch fails (e.g. the remote is unreachable, or doesn't serve single
+    objects), return 0, and let git fetch the blobs lazily.
+    """
+    remote = get_promisor_remote(repo)
+    if remote is None:
+        return 0
+    try:
+        # with a pathspec, rev-list walks only these paths, and doesn't fetch
+        rev_list = _git_with_input(
+            repo,
+            [
+                *("--literal-pathspecs", "rev-list", "--objects", "--missing=print"),
+                *("--no-walk", "--stdin"),
+            ],
+            "\n".join([commit_start, commit_end, "--", *paths]) + "\n",
+        )
+        missing = [line[1:] for line in rev_list.splitlines() if line.startswith("?")]
+        if missing:
+            # the same fetch that git uses to fetch a single missing object
+            _git_with_input(
+                repo,
+                [
+                    *("-c", "fetch.negotiationAlgorithm=noop", "fetch", remote),
+                    *("--no-tags", "--no-write-fetch-head", "--recurse-submodules=no"),
+                    *("--filter=blob:none", "--stdin"),
+                ],
+                "\n".join(missing) + "\n",
+            )
+    except git.exc.GitCommandError:
+        # the prefetch is only an optimization
+        return 0
+    return len(missing)
+
+
+@dataclass(frozen=True, slots=True)
+class RepoInfoResult:
+    """The git information of a repo, and the size of its plain diff."""
+
+    repo_info: dict[str, str]
+    # the tokens of the diff before it was adapted, or None if it wasn't
+    plain_diff_tokens: int | None = None
+
+
+def get_repo_info(
+    repo: git.Repo,
+    commit_range: str,
+    *,
+    adaptive_diff: bool = False,
+    max_diff_tokens: int | None = None,
+) -> dict[str, str]:
+    """Get git information for a specific commit.
+
+    See `read_repo_info` for the options.
+    """
+    return read_repo_info(
+        repo,
+        commit_range,
+        adaptive_diff=adaptive_diff,
+        max_diff_tokens=max_diff_tokens,
+    ).repo_info
+
+
+def read_repo_info(
+    repo: git.Repo,
+    commit_range: str,
+    *,
+    adaptive_diff: bool = False,
+    max_diff_tokens: int | None = None,
+) -> RepoInfoResult:
+    """Get git information for a specific commit, and the size of its plain diff.
+
+    A commit range is read from the objects only, so it works in a bare repo.
+    With `adaptive_diff`, the diff is rendered by `render_adaptive_diff`, and
+    the tokens of the plain diff are returned too. With `max_diff_tokens`, the
+    files that don't fit in the budget are omitted.
+    """
+    untracked_diff: list[str] = []
     if commit_range:
         # Get commit range
         commit_range = commit_range.replace("@", "HEAD")
         commit_start, commit_end = split_commit_range(repo, commit_range)
 
+        # fetch the blobs of a partial clone at once, instead of one by one
+        changed_files = repo.git.diff(
+            "--name-only", "--no-renames", "-z", commit_start, commit_end
+        )
+        prefetch_blobs(
+            repo,
+            commit_start,
+            commit_end,
+            [*filter(None, changed_files.split("\0")), *README_PATHS],
+        )
+
         # Get diff
-        git_diff = repo.git.diff(commit_start, commit_end)
+        diff_args = [commit_start, commit_end]
+        git_diff = repo.git.diff(*diff_args)
 
         # Get ls-files
         git_ls_files = list_files_in_commit(repo.commit(commit_end))
@@ -69,16 +290,36 @@ def get_repo_info(repo: git.Repo, commit_range: str) -> dict[str, str]:
             str(commit.message)
             for commit in repo.iter_commits(f"{commit_start}..{commit_end}")
         )
+    elif repo.bare:
+        # there are no uncommitted changes
+        return read_repo_info(
+            repo, "HEAD", adaptive_diff=adaptive_diff, max_diff_tokens=max_diff_tokens
+        )
     else:
         # use staging area or working directory
         # Get diff
-        git_diff = repo.git.diff("--cached") or repo.git.diff()
-        # FIX: it ignores untracked files
+        diff_args = ["--cached"]
+        git_diff = repo.git.diff(*diff_args)
+        untracked_files = []
         if not git_diff:
-            return get_repo_info(repo, "HEAD")
+            # the working directory includes the untracked files
+            diff_args = []
+            untracked_files = list_untracked_files(repo)
+            untracked_diff = list(iter_untracked_diff(repo, untracked_files))
+            git_diff = "\n".join([repo.git.diff(), *untracked_diff]).strip()
+        if not git_diff:
+            return read_repo_info(
+                repo,
+                "HEAD",
+                adaptive_diff=adaptive_diff,
+                max_diff_tokens=max_diff_tokens,
+            )
 
         # Get ls-files
-        git_ls_files = repo.git.ls_files().splitlines()
+        git_ls_files = [
+            *repo.git.ls_files().splitlines(),
+            *limit_untracked_paths(untracked_files),
+        ]
 
         # commit_end for README
         commit_end = ":0"
@@ -95,24 +336,58 @@ def get_repo_info(repo: git.Repo, commit_range: str) -> dict[str, str]:
 
     # Get README content
     readme_content = ""
-    for readme_path in ["README.md", "README.MD", "Readme.md", "readme.md"]:
+    for readme_path in README_PATHS:
         try:
             readme_content = repo.git.show(f"{commit_end}:{readme_path}")
             break
         except git.exc.GitCommandError:
             continue
 
-    return {
+    repo_info = {
         "git_diff": git_diff.strip(),
         "git_ls_files": "\n".join(git_ls_files).strip(),
         "readme_content": readme_content.strip(),
         "message": message.strip(),
     }
+    plain_diff_tokens = None
+    if adaptive_diff:
+        plain_diff_tokens = estimate_tokens(repo_info["git_diff"])
+        adapted = [render_adaptive_diff(repo, diff_args), *untracked_diff]
+        repo_info["git_diff"] = "\n".join(adapted).strip()
+    if max_diff_tokens:
+        repo_info["git_diff"] = limit_diff(repo_info["git_diff"], max_diff_tokens)
+    return RepoInfoResult(repo_info, plain_diff_tokens)
+
+
+def format_prompt(
+    repo_info: dict[str, str], description: str, examples: str = ""
+) -> str:
+    """Format a commit message prompt from the repo information."""
+    return MESSAGE_FORMAT.format(
+        **repo_info,
+        description=description.strip(),
+        examples=examples.strip(),
+        message_style=MESSAGE_STYLE,
+    )
+
+
+def format_delta_prompt(file_diffs: dict[str, str], removed_files: list[str]) -> str:
+    """Format a follow-up prompt with only the files that changed since last time."""
+    return DELTA_FORMAT.format(
+        git_diff="\n".join(file_diffs.values()).strip(),
+        removed_files="\n".join(removed_files).strip(),
+    )
+
+
+def split_header(header: str) -> tuple[str, str, str]:
+    """Split a header to its emoji prefix, scope and description."""
+    match = re.match(r"^([^\w(]*)(?:\(([^)]*)\))?\s*(.*)$", header)
+    assert match is not None  # noqa: S101
+    emojis, scope, description = match.groups()
+    return emojis.strip(), scope or "", description
 
 
 def get_prompt(repo: git.Repo, commit: str, description: str) -> str:
     """Get a commit message prompt."""
     repo_info = get_repo_info(repo, commit)
-    return MESSAGE_FORMAT.format(
-        **repo_info, description=description.strip(), message_style=MESSAGE_STYLE
-    )
+    return format_prompt(repo_info, description)
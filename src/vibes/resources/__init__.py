@@ -4,4 +4,5 @@ from importlib import resources
 
 files = resources.files(__name__)
 prompt_md = files / "prompt.md"
+delta_prompt_md = files / "delta-prompt.md"
 message_style_emoji_md = files / "message-style-emoji.md"
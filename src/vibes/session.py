@@ -0,0 +1,100 @@
+"""Persist the chat with the LLM, to continue it in a later run.
+
+A session is kept per repo and branch, under the cache dir. It records the chat
+history, a hash of the prompt context, and a hash of each file's diff. When the
+context and HEAD are unchanged, a later run can send only the files whose diff
+changed, on top of the resumed history (which also keeps the provider's prefix
+cache warm).
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import git
+from pydantic import BaseModel, ValidationError
+from pydantic_ai.messages import ModelMessage
+
+from vibes import config
+from vibes.prompt import DELTA_FORMAT, MESSAGE_FORMAT, MESSAGE_STYLE
+
+
+class Session(BaseModel):
+    """A persisted chat about the changes in a repo."""
+
+    head: str
+    prompt_hash: str
+    file_hashes: dict[str, str]
+    messages: list[ModelMessage]
+    last_output: str
+
+    def changed_files(
+        self, file_diffs: dict[str, str]
+    ) -> tuple[dict[str, str], list[str]]:
+        """Get the file diffs that changed since the session, and the removed files."""
+        updated = {
+            path: file_diff
+            for path, file_diff in file_diffs.items()
+            if self.file_hashes.get(path) != _hash(file_diff)
+        }
+        removed = [path for path in self.file_hashes if path not in file_diffs]
+        return updated, removed
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def hash_files(file_diffs: dict[str, str]) -> dict[str, str]:
+    """Hash the diff of each file."""
+    return {path: _hash(file_diff) for path, file_diff in file_diffs.items()}
+
+
+def hash_prompt(repo_info: dict[str, str], description: str) -> str:
+    """Hash the prompt context that a delta prompt can't update.
+
+    The diff and the file list are excluded, since the delta prompt covers them.
+    """
+    context = [MESSAGE_FORMAT, MESSAGE_STYLE, DELTA_FORMAT, description.strip()]
+    context += [repo_info["readme_content"], repo_info["message"]]
+    return _hash("\0".join(context))
+
+
+def get_sessions_dir() -> Path:
+    """Get the directory of the session files."""
+    return config.cache_dir / "sessions"
+
+
+def get_session_path(repo: git.Repo) -> Path:
+    """Get the session file of the repo's current branch."""
+    branch = "HEAD" if repo.head.is_detached else repo.active_branch.name
+    repo_dir = Path(repo.common_dir).resolve()
+    key = _hash(f"{repo_dir}\0{branch}")[:32]
+    return get_sessions_dir() / f"{key}.json"
+
+
+def load_session(session_path: Path) -> Session | None:
+    """Load a session, or return None if it is missing or invalid."""
+    try:
+        return Session.model_validate_json(session_path.read_bytes())
+    except (FileNotFoundError, ValidationError):
+        return None
+
+
+def save_session(session_path: Path, session: Session) -> None:
+    """Save a session atomically."""
+    session_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = session_path.with_name(f"{session_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(session.model_dump_json(), encoding="utf-8")
+    tmp_path.replace(session_path)
+
+
+def prune_sessions(max_sessions: int) -> None:
+    """Delete the least recently saved sessions, to keep at most `max_sessions`."""
+    session_paths = sorted(
+        get_sessions_dir().glob("*.json"),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    for session_path in session_paths[max_sessions:]:
+        session_path.unlink(missing_ok=True)
@@ -0,0 +1,203 @@
+"""Deduplicate the identical requests of concurrent vibes processes.
+
+When several processes (say, a git hook and an editor plugin) ask for a message
+for the same prompt and model at once, only the first one to lock the key sends
+the request. It writes the result to a file, and the others wait for it and
+reuse it. A result that finished before a process started isn't reused, so a
+rerun gets a new message. There is no daemon: the processes coordinate by a
+lock file and a result file per key, under the cache dir.
+
+A lock is stale if its process is dead (when it is on this host), or if it is
+older than `LOCK_TIMEOUT`. A stale lock is moved away by an atomic rename, so
+only one waiting process takes it over.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import sys
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from pydantic import BaseModel, ValidationError
+from pydantic_ai.messages import ModelMessage
+
+from vibes import config
+from vibes.llm import CommitMessageResponse
+
+# a lock older than this is stale, even if its process is alive
+LOCK_TIMEOUT = 600
+# a result is kept for a while, for the waiting processes to read it
+RESULT_MAX_AGE = 30
+POLL_INTERVAL = 0.2
+
+
+class FlightResult(BaseModel):
+    """The result of a request, shared with the duplicate requests."""
+
+    output: CommitMessageResponse
+    messages: list[ModelMessage]
+
+
+class _StoredResult(BaseModel):
+    """A result file."""
+
+    finished: float
+    result: FlightResult
+
+
+@dataclass(frozen=True, slots=True)
+class LockInfo:
+    """The owner of a lock."""
+
+    pid: int
+    host: str
+    time: float
+
+
+def get_flights_dir() -> Path:
+    """Get the directory of the lock and result files."""
+    return config.cache_dir / "flights"
+
+
+def flight_key(prompt: str, *scope: str) -> str:
+    """Get the key of a prompt, and of anything else that changes its result."""
+    return hashlib.sha256("\0".join([prompt, *scope]).encode()).hexdigest()
+
+
+def _read_lock(lock_path: Path) -> LockInfo | None:
+    """Read the owner of a lock, or return None if it is not locked."""
+    try:
+        data = json.loads(lock_path.read_text(encoding="utf-8"))
+        return LockInfo(
+            pid=int(data["pid"]), host=str(data["host"]), time=float(data["time"])
+        )
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError):
+        # the owner is still writing it, or it is corrupted
+        try:
+            return LockInfo(pid=0, host="", time=lock_path.stat().st_mtime)
+        except FileNotFoundError:
+            return None
+
+
+def _is_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        # os.kill can't check a process on windows, so rely on the timeout
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # it's alive, but not ours
+        return True
+    return True
+
+
+def is_stale(lock_info: LockInfo) -> bool:
+    """Check if the owner of a lock is dead, or took too long."""
+    if time.time() - lock_info.time > LOCK_TIMEOUT:
+        return True
+    if lock_info.pid and lock_info.host == socket.gethostname():
+        return not _is_alive(lock_info.pid)
+    return False
+
+
+def _try_lock(lock_path: Path, lock_info: LockInfo) -> bool:
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(asdict(lock_info), f)
+    return True
+
+
+def _take_over(lock_path: Path, stale_info: LockInfo) -> None:
+    """Remove a stale lock, unless it was replaced since it was read."""
+    stale_path = lock_path.with_name(f"{lock_path.name}.{uuid.uuid4().hex}.stale")
+    try:
+        # atomic, so only one process moves the lock
+        lock_path.rename(stale_path)
+    except FileNotFoundError:
+        return
+    if _read_lock(stale_path) != stale_info:
+        # another process took over first, and this is its lock, so restore it
+        with contextlib.suppress(FileExistsError):
+            lock_path.hardlink_to(stale_path)
+    stale_path.unlink(missing_ok=True)
+
+
+def _release(lock_path: Path, lock_info: LockInfo) -> None:
+    if _read_lock(lock_path) == lock_info:
+        lock_path.unlink(missing_ok=True)
+
+
+def _read_result(result_path: Path, since: float) -> FlightResult | None:
+    """Read a result that finished since a time, or return None if there is none."""
+    try:
+        stored = _StoredResult.model_validate_json(result_path.read_bytes())
+    except (FileNotFoundError, ValidationError):
+        return None
+    return stored.result if stored.finished >= since else None
+
+
+def _write_result(result_path: Path, result: FlightResult) -> None:
+    """Write a result atomically."""
+    stored = _StoredResult(finished=time.time(), result=result)
+    tmp_path = result_path.with_name(f"{result_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(stored.model_dump_json(), encoding="utf-8")
+    tmp_path.replace(result_path)
+
+
+def _prune_results(flights_dir: Path) -> None:
+    """Delete the results that no process waits for anymore."""
+    for result_path in flights_dir.glob("*.json"):
+        with contextlib.suppress(FileNotFoundError):
+            if time.time() - result_path.stat().st_mtime > RESULT_MAX_AGE:
+                result_path.unlink()
+
+
+async def single_flight(
+    key: str, call: Callable[[], Awaitable[FlightResult]]
+) -> tuple[FlightResult, bool]:
+    """Make a request once, for all the concurrent processes with the same key.
+
+    Return the result, and whether it was shared by another process. Only a
+    result that finished while this process waited is shared. If the process
+    that makes the request fails, a waiting process makes it instead.
+    """
+    started = time.time()
+    flights_dir = get_flights_dir()
+    flights_dir.mkdir(parents=True, exist_ok=True)
+    _prune_results(flights_dir)
+    lock_path = flights_dir / f"{key}.lock"
+    result_path = flights_dir / f"{key}.json"
+    while True:
+        lock_info = LockInfo(
+            pid=os.getpid(), host=socket.gethostname(), time=time.time()
+        )
+        if _try_lock(lock_path, lock_info):
+            try:
+                # a concurrent duplicate may have just finished
+                if (shared_result := _read_result(result_path, started)) is not None:
+                    return shared_result, True
+                result = await call()
+                _write_result(result_path, result)
+                return result, False
+            finally:
+                _release(lock_path, lock_info)
+        owner_info = _read_lock(lock_path)
+        if owner_info is not None and is_stale(owner_info):
+            _take_over(lock_path, owner_info)
+        elif owner_info is not None:
+            # when the owner releases the lock, its result is read under the lock
+            await asyncio.sleep(POLL_INTERVAL)
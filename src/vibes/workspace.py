@@ -0,0 +1,139 @@
+"""Get commit messages for all the dirty repos in a workspace."""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import git
+from pydantic_ai import Agent
+
+from vibes.config import Settings
+from vibes.diff import split_diff
+from vibes.ledger import UsageContext, diff_size_bucket, usage_context
+from vibes.llm import CommitMessageResponse
+from vibes.prompt import format_prompt, get_repo_info
+
+
+def find_dirty_repos(root: Path) -> list[Path]:
+    """Find all the dirty repos (including nested repos and submodules) under root.
+
+    A repo is recognized by its `.git` entry, which is a directory for a regular
+    repo and a file for a submodule or a worktree. A repo that can't be read is
+    included too, so its error is reported with the other repos.
+    """
+    repo_paths: list[Path] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if ".git" in dirnames or ".git" in filenames:
+            repo_path = Path(dirpath)
+            try:
+                with git.Repo(repo_path) as repo:
+                    is_dirty = repo.is_dirty(untracked_files=True)
+            except git.GitError:
+                is_dirty = True
+            if is_dirty:
+                repo_paths.append(repo_path)
+        # don't walk into the git internals
+        if ".git" in dirnames:
+            dirnames.remove(".git")
+        dirnames.sort()
+    return repo_paths
+
+
+def _get_repo_info(repo_path: Path, settings: Settings) -> dict[str, str] | Exception:
+    try:
+        with git.Repo(repo_path) as repo:
+            return get_repo_info(
+                repo,
+                "",
+                adaptive_diff=settings.adaptive_diff,
+                max_diff_tokens=settings.max_diff_tokens,
+            )
+    except Exception as e:  # noqa: BLE001
+        # a broken repo shouldn't stop the other repos
+        return e
+
+
+def gather_repo_infos(
+    repo_paths: list[Path], settings: Settings
+) -> dict[Path, dict[str, str] | Exception]:
+    """Get the git information of all the repos, in parallel.
+
+    The diffs follow the diff settings, and up to `settings.concurrency` repos
+    are read at once. A repo that fails doesn't stop the others, and its
+    exception is returned instead.
+    """
+    with ThreadPoolExecutor(max_workers=settings.concurrency) as executor:
+        repo_infos = executor.map(
+            functools.partial(_get_repo_info, settings=settings), repo_paths
+        )
+        return dict(zip(repo_paths, repo_infos, strict=True))
+
+
+def repo_name(repo_path: Path, root: Path) -> str:
+    """Get a display name of the repo, relative to the workspace root."""
+    name = repo_path.resolve().relative_to(root.resolve()).as_posix()
+    return name if name != "." else root.resolve().name
+
+
+def summarize_workspace(repo_infos: dict[Path, dict[str, str]], root: Path) -> str:
+    """Summarize the cross-repo change, by the files changed in each repo."""
+    lines = ["This change is part of a cross-repo change, that modifies:"]
+    for repo_path, repo_info in repo_infos.items():
+        lines.append(f"- {repo_name(repo_path, root)}:")
+        lines.extend(f"  - {path}" for path in split_diff(repo_info["git_diff"]))
+    return "\n".join(lines)
+
+
+def get_workspace_prompts(
+    repo_infos: dict[Path, dict[str, str]], root: Path, description: str
+) -> dict[Path, str]:
+    """Get a commit message prompt for each repo, with a shared summary."""
+    summary = summarize_workspace(repo_infos, root)
+    shared_description = f"{description}\n\n{summary}" if description else summary
+    return {
+        repo_path: format_prompt(repo_info, shared_description)
+        for repo_path, repo_info in repo_infos.items()
+    }
+
+
+def get_usage_contexts(
+    repo_infos: dict[Path, dict[str, str]],
+) -> dict[Path, UsageContext]:
+    """Get the ledger context of each repo."""
+    return {
+        repo_path: UsageContext(
+            repo=repo_path.resolve().name,
+            diff_size=diff_size_bucket(len(repo_info["git_diff"])),
+        )
+        for repo_path, repo_info in repo_infos.items()
+    }
+
+
+async def generate_messages(
+    agent: Agent[None, CommitMessageResponse],
+    prompts: dict[Path, str],
+    concurrency: int,
+    usage_contexts: dict[Path, UsageContext] | None = None,
+) -> dict[Path, CommitMessageResponse | BaseException]:
+    """Ask the model for a commit message for each prompt, concurrently.
+
+    At most `concurrency` requests are in flight at once. A failed request
+    doesn't cancel the others, and its exception is returned instead.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    usage_contexts = usage_contexts or {}
+
+    async def generate(repo_path: Path, prompt: str) -> CommitMessageResponse:
+        # each task runs in a copy of the context
+        usage_context.set(usage_contexts.get(repo_path, UsageContext()))
+        async with semaphore:
+            result = await agent.run(prompt)
+            return result.output
+
+    responses = await asyncio.gather(
+        *(generate(repo_path, prompt) for repo_path, prompt in prompts.items()),
+        return_exceptions=True,
+    )
+    return dict(zip(prompts, responses, strict=True))
@@ -0,0 +1,15 @@
+"""Shared fixtures for the tests."""
+
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(
+    tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    """Keep the cache of each test in a temporary dir."""
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setattr("vibes.config.cache_dir", path)
+    return path
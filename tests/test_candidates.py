@@ -0,0 +1,107 @@
+"""Tests for the candidates module."""
+
+import asyncio
+from pathlib import Path
+
+import git
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.models.test import TestModel
+from pytest_mock import MockerFixture
+
+from vibes.candidates import (
+    GITMOJIS,
+    STYLE_HINTS,
+    generate_candidates,
+    parse_gitmojis,
+    path_similarity,
+    rank_candidates,
+    score_message,
+)
+from vibes.cli import app
+from vibes.llm import CommitMessageResponse
+
+
+def test_parse_gitmojis() -> None:
+    style = "# Emojis\n✨ = Introduce new features.\n⚡️ = Improve performance.\n"
+    assert parse_gitmojis(style) == {"✨", "⚡"}
+    assert {"✨", "🐛", "⚡"} <= GITMOJIS
+
+
+@pytest.mark.parametrize(
+    ("message", "problems"),
+    [
+        ("✨ Add a feature", ()),
+        ("⚡️ (cli) Speed up the startup", ()),
+        ("✨🐛 Add a feature and fix a bug", ()),
+        ("Add a feature", ("header doesn't start with a gitmoji",)),
+        ("🦄 Add a feature", ("header doesn't start with a gitmoji",)),
+        (f"✨ {'x' * 80}", ("header is longer than 72 chars",)),
+        ("✨ (cli) cli: Add a flag", ("header has a duplicated scope",)),
+        ("✨ (cli) (cli) Add a flag", ("header has a duplicated scope",)),
+        ("✨ (cli) Add --foo option (default 3)", ()),
+    ],
+)
+def test_score_message_problems(message: str, problems: tuple[str, ...]) -> None:
+    assert score_message(message, [])[1] == problems
+
+
+def test_path_similarity() -> None:
+    paths = ["src/vibes/prompt.py"]
+    assert path_similarity("✨ Add vibes prompt", paths) == 2 / 3
+    assert path_similarity("✨ Add a flag", paths) == 0
+    assert path_similarity("✨ Add a flag", []) == 0
+
+
+def _candidates_model() -> FunctionModel:
+    """Get a model that answers each style hint with a different message."""
+    messages = {
+        "": "Add the prompt module without an emoji",
+        STYLE_HINTS[1]: "✨ Add the prompt module",
+        STYLE_HINTS[2]: "✨ Add a module",
+    }
+
+    def respond(history: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        prompt = str(history[-1].parts[-1].content)  # type: ignore[union-attr]
+        hint = prompt.rsplit("## Style hint\n", 1)[1] if "Style hint" in prompt else ""
+        args = {"message": messages[hint], "emoji_legend": {}}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    return FunctionModel(respond)
+
+
+def test_generate_and_rank_candidates() -> None:
+    agent = Agent(_candidates_model(), output_type=CommitMessageResponse)
+    results = asyncio.run(generate_candidates(agent, "prompt", 3))
+    assert len(results) == 3
+    ranked = rank_candidates(results, ["src/prompt.py"])
+    assert [c.response.message for c in ranked] == [
+        "✨ Add the prompt module",
+        "✨ Add a module",
+        "Add the prompt module without an emoji",
+    ]
+    assert ranked[-1].problems == ("header doesn't start with a gitmoji",)
+
+
+def test_cli_candidates(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str], mocker: MockerFixture
+) -> None:
+    mocker.patch(
+        "vibes.cli.get_agent",
+        return_value=Agent(TestModel(), output_type=CommitMessageResponse),
+    )
+    repo = git.Repo.init(tmp_path)
+    (tmp_path / "file.txt").write_text("hello\n")
+    repo.index.add(["file.txt"])
+    repo.index.commit("init")
+    (tmp_path / "file.txt").write_text("hello world\n")
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(tmp_path), "--candidates", "2", "-s"])
+    assert exc_info.value.code == 0
+    captured = capsys.readouterr().out
+    assert "[1] (" in captured
+    assert "[2] (" in captured
+    repo.close()
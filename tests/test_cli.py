@@ -65,3 +65,52 @@ def test_bad_commit_ref(
     assert exc_info.value.code == 1
     assert "Error" in capsys.readouterr().err
     repo.close()
+
+
+def test_adaptive_diff_reports_savings(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """--adaptive-diff should report the token savings to stderr."""
+    repo = git.Repo.init(tmp_path)
+    (tmp_path / "notes.txt").write_text("the old notes\n")
+    repo.index.add(["notes.txt"])
+    repo.index.commit("init")
+    (tmp_path / "notes.txt").write_text("the new notes\n")
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(tmp_path), "--only-prompt", "--adaptive-diff"])
+    assert exc_info.value.code == 0
+    captured = capsys.readouterr()
+    assert "the [-old-]{+new+} notes" in captured.out
+    assert "Adaptive diff: ~" in captured.err
+    repo.close()
+
+
+def test_settings_from_repo_config_file(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """The repo-local config file and the profile set the defaults of options."""
+    repo = git.Repo.init(tmp_path)
+    (tmp_path / "notes.txt").write_text("the old notes\n")
+    repo.index.add(["notes.txt"])
+    repo.index.commit("init")
+    (tmp_path / "notes.txt").write_text("the new notes\n")
+    (tmp_path / ".vibes.toml").write_text("adaptive_diff = true\n")
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(tmp_path), "--only-prompt"])
+    assert exc_info.value.code == 0
+    assert "the [-old-]{+new+} notes" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(tmp_path), "--only-prompt", "--no-adaptive-diff"])
+    assert exc_info.value.code == 0
+    assert "+the new notes" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(tmp_path), "--only-prompt", "--profile", "nope"])
+    assert exc_info.value.code == 1
+    assert "Unknown profile" in capsys.readouterr().err
+    repo.close()
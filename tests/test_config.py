@@ -183,3 +183,172 @@ model = "gpt-4o"
             pytest.raises(ValueError, match="No model found"),
         ):
             cfg.get_model()
+
+
+class TestGetOutputMode:
+    def test_default(self, tmp_path: Path) -> None:
+        with _config_env(tmp_path, 'provider = "openai"\n') as cfg:
+            assert cfg.get_output_mode() == "tool"
+
+    def test_from_config_file(self, tmp_path: Path) -> None:
+        toml = """\
+provider = "openai"
+
+[providers.openai]
+output_mode = "native"
+"""
+        with _config_env(tmp_path, toml, env={"OPENAI_OUTPUT_MODE": "prompted"}) as cfg:
+            assert cfg.get_output_mode() == "native"
+
+    def test_from_env_var(self, tmp_path: Path) -> None:
+        with _config_env(
+            tmp_path,
+            'provider = "anthropic"\n',
+            env={"ANTHROPIC_OUTPUT_MODE": "prompted"},
+        ) as cfg:
+            assert cfg.get_output_mode() == "prompted"
+
+    def test_invalid_raises(self, tmp_path: Path) -> None:
+        with (
+            _config_env(
+                tmp_path, 'provider = "openai"\n', env={"OPENAI_OUTPUT_MODE": "json"}
+            ) as cfg,
+            pytest.raises(ValueError, match="output_mode"),
+        ):
+            cfg.get_output_mode()
+
+
+class TestGetSettings:
+    def test_defaults(self, tmp_path: Path) -> None:
+        with _config_env(tmp_path) as cfg:
+            settings = cfg.get_settings()
+            assert settings.few_shot == 3
+            assert settings.candidates == 1
+            assert settings.timeout is None
+
+    def test_merges_repo_config_file_and_env(self, tmp_path: Path) -> None:
+        repo_dir = tmp_path / "repo"
+        repo_dir.mkdir()
+        (repo_dir / ".vibes.toml").write_text("few_shot = 1\n")
+        toml = "few_shot = 5\ncandidates = 2\n"
+        env = {"VIBES_CANDIDATES": "4", "VIBES_TIMEOUT": "10"}
+        with _config_env(tmp_path, toml, env=env) as cfg:
+            settings = cfg.get_settings(repo_dir=repo_dir)
+            assert settings.few_shot == 1
+            assert settings.candidates == 2
+            assert settings.timeout == 10
+            assert cfg.get_settings().few_shot == 5
+
+    def test_profiles(self, tmp_path: Path) -> None:
+        toml = """\
+few_shot = 2
+
+[profiles.fast]
+timeout = 5
+
+[profiles.mine]
+candidates = 2
+"""
+        with _config_env(tmp_path, toml) as cfg:
+            fast = cfg.get_settings("fast")
+            # the built-in profile is updated, not replaced
+            assert (fast.timeout, fast.few_shot, fast.adaptive_diff) == (5, 0, True)
+            mine = cfg.get_settings("mine")
+            assert (mine.candidates, mine.few_shot) == (2, 2)
+            assert cfg.get_settings("thorough").candidates == 3
+
+    @pytest.mark.parametrize(
+        ("repo_toml", "setting"),
+        [
+            ('profile = "thorough"\n', "profile"),
+            ("candidates = 10\n", "candidates"),
+            ("[profiles.fast]\ncandidates = 10\n", "candidates"),
+        ],
+    )
+    def test_spending_in_repo_config_file_raises(
+        self, tmp_path: Path, repo_toml: str, setting: str
+    ) -> None:
+        (tmp_path / ".vibes.toml").write_text(repo_toml)
+        with (
+            _config_env(tmp_path) as cfg,
+            pytest.raises(ValueError, match=f"Don't set '{setting}'"),
+        ):
+            cfg.get_settings(repo_dir=tmp_path)
+
+    def test_model_routing(self, tmp_path: Path) -> None:
+        toml = """\
+provider = "openai"
+
+[providers.mistral]
+model = "mistral-large"
+
+[profiles.fast]
+model = "gpt-5-nano"
+
+[profiles.other]
+provider = "mistral"
+"""
+        env = {"MISTRAL_API_KEY": "test-key"}  # pragma: allowlist secret
+        with _config_env(tmp_path, toml, env=env) as cfg:
+            assert cfg.get_model() == "gpt-5"
+            assert cfg.get_settings("fast").model == "gpt-5-nano"
+            assert cfg.get_settings("other").provider == "mistral"
+            assert cfg.get_model("mistral") == "mistral-large"
+            assert cfg.get_api_key("mistral") == "test-key"
+
+    @pytest.mark.parametrize(
+        "repo_toml",
+        [
+            'provider = "openai"\n',
+            'model = "gpt-5"\n',
+            '[providers.openai]\nmodel = "gpt-5"\n',
+            '[profiles.fast]\nprovider = "openai"\n',
+        ],
+    )
+    def test_routing_in_repo_config_file_raises(
+        self, tmp_path: Path, repo_toml: str
+    ) -> None:
+        (tmp_path / ".vibes.toml").write_text(repo_toml)
+        with (
+            _config_env(tmp_path) as cfg,
+            pytest.raises(ValueError, match="Don't set a provider or a model"),
+        ):
+            cfg.get_settings(repo_dir=tmp_path)
+
+    def test_is_memoized(self, tmp_path: Path) -> None:
+        with _config_env(tmp_path, "few_shot = 2\n") as cfg:
+            assert cfg.load_config() is cfg.load_config()
+
+    def test_unknown_profile_raises(self, tmp_path: Path) -> None:
+        with (
+            _config_env(tmp_path) as cfg,
+            pytest.raises(ValueError, match="Unknown profile 'nope'"),
+        ):
+            cfg.get_settings("nope")
+
+    @pytest.mark.parametrize(
+        ("toml", "setting"),
+        [
+            ("candidates = 0\n", "candidates"),
+            ("candidates = 100\n", "candidates"),
+            ("concurrency = 1000\n", "concurrency"),
+        ],
+    )
+    def test_invalid_setting_raises(
+        self, tmp_path: Path, toml: str, setting: str
+    ) -> None:
+        with (
+            _config_env(tmp_path, toml) as cfg,
+            pytest.raises(ValueError, match=setting),
+        ):
+            cfg.get_settings()
+
+    def test_api_key_in_repo_config_file_raises(self, tmp_path: Path) -> None:
+        (tmp_path / ".vibes.toml").write_text(
+            '[providers.openai]\napi_key = "sk-..."\n'  # pragma: allowlist secret
+        )
+        with (
+            _config_env(tmp_path) as cfg,
+            pytest.raises(ValueError, match="Don't set an API key"),
+        ):
+            cfg.get_settings(repo_dir=tmp_path)
@@ -0,0 +1,160 @@
+"""Tests for the diff module."""
+
+from collections.abc import Generator
+from pathlib import Path
+
+import git
+import pytest
+
+from vibes.diff import (
+    choose_context,
+    collapse_repeated_hunks,
+    estimate_tokens,
+    format_savings,
+    limit_diff,
+    parse_hunks,
+    render_adaptive_diff,
+    split_diff,
+    unquote_path,
+)
+from vibes.prompt import read_repo_info
+
+CODE = "".join(f"line {i}\n" for i in range(100))
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Generator[git.Repo]:
+    repo = git.Repo.init(tmp_path)
+    for name in ["a.py", "b.py", "c.py", "moved.py"]:
+        (tmp_path / name).write_text(f"import old\n\n{CODE}{name}\n")
+    (tmp_path / "README.md").write_text("This is the old readme.\n")
+    repo.index.add(["a.py", "b.py", "c.py", "moved.py", "README.md"])
+    repo.index.commit("init")
+    yield repo
+    repo.close()
+
+
+def test_split_diff() -> None:
+    git_diff = (
+        "diff --git a/x b/x\n--- a/x\n+++ b/x\n@@ -1 +1 @@\n-a\n+b\n"
+        "diff --git a/old b/new\nrename from old\nrename to new"
+    )
+    assert split_diff(git_diff) == {
+        "x": "diff --git a/x b/x\n--- a/x\n+++ b/x\n@@ -1 +1 @@\n-a\n+b",
+        "new": "diff --git a/old b/new\nrename from old\nrename to new",
+    }
+
+
+def test_unquote_path() -> None:
+    assert unquote_path("plain name.txt") == "plain name.txt"
+    assert unquote_path('"sp ace \\303\\274.txt"') == "sp ace ü.txt"
+    assert unquote_path('"tab\\there \\"q\\" \\\\"') == 'tab\there "q" \\'
+
+
+def test_split_diff_of_special_paths(repo: git.Repo) -> None:
+    repo_path = Path(repo.working_dir)
+    names = ["a b.txt", "sp ace ü.txt", 'quo"te.txt']
+    for name in names:
+        (repo_path / name).write_text("old\n")
+    repo.index.add(names)
+    repo.index.commit("special paths")
+    for name in names:
+        # distinct changes, so the hunks aren't collapsed
+        (repo_path / name).write_text(f"new {name}\n")
+    repo.git.mv("a.py", "re named ü.py")
+    file_diffs = split_diff(repo.git.diff("HEAD"))
+    assert sorted(file_diffs) == sorted([*names, "re named ü.py"])
+    # the paths work as pathspecs
+    adaptive = split_diff(render_adaptive_diff(repo, ["HEAD"]))
+    assert sorted(adaptive) == sorted(file_diffs)
+    assert "{+new sp ace ü.txt+}" in adaptive["sp ace ü.txt"]
+
+
+def test_choose_context() -> None:
+    assert choose_context([]) == 3
+    assert choose_context([(1, 1), (50, 1), (90, 1)]) == 3
+    # many hunks, far apart
+    assert choose_context([(1, 1), (20, 2), (40, 1), (60, 1)]) == 1
+    # many hunks, close together
+    assert choose_context([(1, 1), (3, 2), (6, 1), (8, 1)]) == 0
+
+
+def test_parse_hunks() -> None:
+    assert parse_hunks("@@ -1,2 +1,3 @@ def f():\n+x\n@@ -10 +11 @@\n+y") == [
+        (1, 3),
+        (11, 1),
+    ]
+
+
+def test_collapse_repeated_hunks() -> None:
+    file_diffs = {
+        "a": "diff --git a/a b/a\n@@ -1 +1 @@\n-old\n+new\n@@ -9 +9 @@\n-a\n+b",
+        "b": "diff --git a/b b/b\n@@ -5 +5 @@\n-old\n+new",
+        "c": "diff --git a/c b/c\n@@ -3 +3 @@\n-old\n+new",
+    }
+    assert collapse_repeated_hunks(file_diffs) == {
+        "a": "diff --git a/a b/a\n@@ -1 +1 @@\n-old\n+new\n"
+        "# the same hunk is also in: b, c\n@@ -9 +9 @@\n-a\n+b",
+        "b": "diff --git a/b b/b",
+        "c": "diff --git a/c b/c",
+    }
+
+
+def test_render_adaptive_diff(repo: git.Repo) -> None:
+    repo_path = Path(repo.working_dir)
+    # a sweeping change, repeated in several files
+    for name in ["a.py", "b.py", "c.py"]:
+        (repo_path / name).write_text(f"import new\n\n{CODE}{name}\n")
+    # a prose change
+    (repo_path / "README.md").write_text("This is the new readme.\n")
+    # many changes, far apart
+    lines = CODE.splitlines(keepends=True)
+    for i in range(10, 100, 20):
+        lines[i] = "changed\n"
+    (repo_path / "a.py").write_text(f"import new\n\n{''.join(lines)}a.py\n")
+    # a rename
+    repo.git.mv("moved.py", "renamed.py")
+
+    file_diffs = split_diff(render_adaptive_diff(repo, ["HEAD"]))
+    assert list(file_diffs) == ["README.md", "a.py", "b.py", "c.py", "renamed.py"]
+    assert "This is the [-old-]{+new+} readme." in file_diffs["README.md"]
+    # a single line of context
+    assert " line 29\n-line 30\n+changed\n line 31\n@@" in file_diffs["a.py"]
+    assert "# the same hunk is also in: c.py" in file_diffs["b.py"]
+    assert "# the same hunk" not in file_diffs["a.py"]
+    assert "@@" not in file_diffs["c.py"]
+    assert "rename from moved.py" in file_diffs["renamed.py"]
+
+
+def test_get_repo_info_with_adaptive_diff(repo: git.Repo) -> None:
+    repo_path = Path(repo.working_dir)
+    for name in ["a.py", "b.py", "c.py"]:
+        (repo_path / name).write_text(f"import new\n\n{CODE}{name}\n")
+    plain = read_repo_info(repo, "")
+    adaptive = read_repo_info(repo, "", adaptive_diff=True)
+    plain_diff = plain.repo_info["git_diff"]
+    assert adaptive.plain_diff_tokens == estimate_tokens(plain_diff)
+    assert len(adaptive.repo_info["git_diff"]) < len(plain_diff)
+    assert plain.plain_diff_tokens is None
+    assert "plain_diff_tokens" not in adaptive.repo_info
+
+
+def test_format_savings() -> None:
+    assert format_savings(200, 150) == (
+        "Adaptive diff: ~150 tokens instead of ~200 (25% saved)"
+    )
+    assert format_savings(0, 0).endswith("(0% saved)")
+
+
+def test_limit_diff() -> None:
+    git_diff = "\n".join(
+        f"diff --git a/{name} b/{name}\n@@ -1 +1 @@\n-{'x' * size}\n+y"
+        for name, size in [("a", 10), ("b", 100), ("c", 10)]
+    )
+    assert limit_diff(git_diff, 1000) == git_diff
+    limited = limit_diff(git_diff, 30)
+    assert limited.startswith("# 1 more files are omitted: b\n")
+    # the list of omitted files isn't a part of a file
+    file_diffs = split_diff(limited)
+    assert list(file_diffs) == ["a", "c"]
+    assert "omitted" not in file_diffs["c"]
@@ -0,0 +1,161 @@
+"""Tests for the history module."""
+
+import timeit
+from collections.abc import Generator
+from pathlib import Path
+
+import git
+import pytest
+from pytest_benchmark.fixture import BenchmarkFixture
+
+from vibes.cli import app
+from vibes.history import (
+    DIR_WEIGHT,
+    FILE_WEIGHT,
+    MAX_QUERY_PATHS,
+    HistoryIndex,
+    get_examples,
+    get_index_path,
+    iter_past_commits,
+)
+
+LARGE_HISTORY = 100_000
+MAX_SIMILAR_SECONDS = 0.05
+
+
+def _commit(repo: git.Repo, message: str, files: dict[str, str]) -> None:
+    for name, content in files.items():
+        path = Path(repo.working_dir) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    repo.index.add(list(files))
+    repo.index.commit(message)
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Generator[git.Repo]:
+    repo = git.Repo.init(tmp_path)
+    _commit(repo, "🎉 Begin a project", {"README.md": "readme\n"})
+    _commit(repo, "✨ (cli) Add the cli\n\nWith a body.", {"src/cli.py": "cli\n"})
+    _commit(repo, "📝 Document the cli", {"README.md": "cli docs\n"})
+    _commit(repo, "🐛 (cli) Fix the cli", {"src/cli.py": "fixed\n"})
+    _commit(repo, "✨ Add the prompt", {"src/prompt.py": "prompt\n"})
+    yield repo
+    repo.close()
+
+
+def test_iter_past_commits(repo: git.Repo) -> None:
+    past_commits = list(iter_past_commits(repo, "HEAD~2..HEAD"))
+    assert [c.header for c in past_commits] == [
+        "✨ Add the prompt",
+        "🐛 (cli) Fix the cli",
+    ]
+    assert past_commits[1].emoji == "🐛"
+    assert past_commits[1].scope == "cli"
+    assert past_commits[1].paths == ("src/cli.py",)
+    (first,) = [c for c in iter_past_commits(repo, "HEAD") if "Add the cli" in c.header]
+    assert first.message == "✨ (cli) Add the cli\n\nWith a body."
+
+
+def test_update_is_incremental(repo: git.Repo, tmp_path: Path) -> None:
+    index = HistoryIndex(tmp_path / "index.sqlite")
+    assert index.update(repo) == 5
+    assert index.tips == [repo.head.commit.hexsha]
+    assert index.update(repo) == 0
+    _commit(repo, "✅ Test the cli", {"tests/test_cli.py": "test\n"})
+    assert index.update(repo) == 1
+    assert index.tips == [repo.head.commit.hexsha]
+    index.close()
+
+
+def test_update_after_rewrite(repo: git.Repo, tmp_path: Path) -> None:
+    index = HistoryIndex(tmp_path / "index.sqlite")
+    index.update(repo)
+    old_head = repo.head.commit.hexsha
+    # only the new commit of a rewritten history is indexed
+    repo.git.reset("--hard", "HEAD~2")
+    _commit(repo, "✨ Add the prompt again", {"src/prompt.py": "prompt 2\n"})
+    assert index.update(repo) == 1
+    assert sorted(index.tips) == sorted([old_head, repo.head.commit.hexsha])
+    # and switching back indexes nothing
+    repo.git.reset("--hard", old_head)
+    assert index.update(repo) == 0
+    (count,) = index.connection.execute("SELECT COUNT(*) FROM commits").fetchone()
+    assert count == 6
+    index.close()
+
+
+def test_similar(repo: git.Repo, tmp_path: Path) -> None:
+    index = HistoryIndex(tmp_path / "index.sqlite")
+    index.update(repo)
+    similar = index.similar(["src/cli.py"], k=3)
+    # same file first (newest first), then the same directory
+    assert [c.header for c in similar] == [
+        "🐛 (cli) Fix the cli",
+        "✨ (cli) Add the cli",
+        "✨ Add the prompt",
+    ]
+    similar = index.similar(["src/cli.py"], k=1, exclude=[repo.head.commit.hexsha])
+    assert [c.header for c in similar] == ["🐛 (cli) Fix the cli"]
+    assert index.similar(["other.txt"], k=3) == []
+    assert index.similar(["src/cli.py"], k=0) == []
+    index.close()
+
+
+@pytest.fixture(scope="module")
+def large_index(tmp_path_factory: pytest.TempPathFactory) -> Generator[HistoryIndex]:
+    """Get an index of a long history, where each commit touches 2 of 500 files."""
+    index = HistoryIndex(tmp_path_factory.mktemp("history") / "index.sqlite")
+    with index.connection:
+        index.connection.executemany(
+            "INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (i, f"{i:040x}", f"✨ Commit {i}", "✨", "", f"✨ Commit {i}")
+                for i in range(1, LARGE_HISTORY + 1)
+            ),
+        )
+        index.connection.executemany(
+            "INSERT INTO paths VALUES (?, ?, ?)",
+            (
+                row
+                for i in range(1, LARGE_HISTORY + 1)
+                for j in (i % 500, (i * 7) % 500)
+                for row in (
+                    (f"src/pkg{j % 20}/mod{j}.py", FILE_WEIGHT, i),
+                    (f"src/pkg{j % 20}/", DIR_WEIGHT, i),
+                )
+            ),
+        )
+    yield index
+    index.close()
+
+
+def test_similar_on_large_history(
+    large_index: HistoryIndex, benchmark: BenchmarkFixture
+) -> None:
+    paths = [f"src/pkg{j % 20}/mod{j}.py" for j in range(MAX_QUERY_PATHS)]
+    similar = benchmark(large_index.similar, paths, 3)
+    assert len(similar) == 3
+    # check the limit also when the benchmarks are disabled
+    seconds = min(
+        timeit.repeat(lambda: large_index.similar(paths, 3), number=1, repeat=5)
+    )
+    assert seconds < MAX_SIMILAR_SECONDS
+
+
+def test_get_examples(repo: git.Repo, cache_dir: Path) -> None:
+    examples = get_examples(repo, ["README.md"], k=2)
+    assert examples == "📝 Document the cli\n\n🎉 Begin a project"
+    assert get_index_path(repo).is_relative_to(cache_dir)
+    assert get_examples(repo, ["README.md"], k=0) == ""
+
+
+def test_prompt_examples_exclude_analyzed_commits(
+    repo: git.Repo, capsys: pytest.CaptureFixture[str]
+) -> None:
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(repo.working_dir), "-c", "HEAD~1", "--only-prompt"])
+    assert exc_info.value.code == 0
+    examples = capsys.readouterr().out.split("## Similar past commits")[1]
+    assert "✨ (cli) Add the cli" in examples
+    assert "🐛 (cli) Fix the cli" not in examples
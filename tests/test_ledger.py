@@ -0,0 +1,115 @@
+"""Tests for the ledger module."""
+
+import asyncio
+import dataclasses
+import sqlite3
+from pathlib import Path
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+
+from vibes.cli import app
+from vibes.ledger import (
+    Ledger,
+    LedgerModel,
+    UsageContext,
+    UsageRecord,
+    diff_size_bucket,
+    get_ledger_path,
+    get_stats,
+    usage_context,
+)
+
+
+def _record(
+    model: str, latency: float, run_id: str = "run", **kwargs: int
+) -> UsageRecord:
+    return UsageRecord(
+        timestamp=1000,
+        run_id=run_id,
+        provider="test",
+        model=model,
+        prompt_tokens=kwargs.get("prompt_tokens", 100),
+        cached_tokens=kwargs.get("cached_tokens", 0),
+        output_tokens=kwargs.get("output_tokens", 10),
+        latency=latency,
+        repo="repo",
+        diff_size="<1k",
+    )
+
+
+def test_diff_size_bucket() -> None:
+    assert diff_size_bucket(0) == "<1k"
+    assert diff_size_bucket(1_000) == "1k-10k"
+    assert diff_size_bucket(99_999) == "10k-100k"
+    assert diff_size_bucket(100_000) == ">100k"
+
+
+def test_ledger_model_records_requests(tmp_path: Path) -> None:
+    path = tmp_path / "ledger.sqlite"
+    with Ledger(path) as ledger:
+        agent = Agent(LedgerModel(TestModel(), ledger, "test"))
+        usage_context.set(UsageContext(repo="my-repo", diff_size="<1k"))
+        asyncio.run(agent.run("hello"))
+        asyncio.run(agent.run("hello again"))
+
+    (model_stats,) = get_stats(path)
+    assert model_stats.model == "test"
+    assert model_stats.requests == 2
+    # both requests are from the same run and repo
+    assert model_stats.tokens_per_commit > 0
+    assert model_stats.latency_p95 >= model_stats.latency_p50
+
+
+def test_get_stats(tmp_path: Path) -> None:
+    path = tmp_path / "ledger.sqlite"
+    with Ledger(path) as ledger:
+        for i in range(1, 21):
+            ledger.record(_record("fast", i / 10, cached_tokens=50))
+        ledger.record(_record("slow", 5, run_id="run-1"))
+        ledger.record(_record("slow", 7, run_id="run-2"))
+        ledger.record(_record("slow", 9, run_id="run-3"))
+
+    fast, slow = get_stats(path)
+    assert fast.model == "fast"
+    assert fast.requests == 20
+    assert fast.latency_p50 == pytest.approx(1.05)
+    assert fast.latency_p95 == pytest.approx(1.905)
+    assert fast.tokens_per_commit == 20 * 110
+    assert fast.cache_hit_rate == 0.5
+    assert slow.tokens_per_commit == 110
+    assert slow.cache_hit_rate == 0
+    assert get_stats(path, since=2000) == []
+    assert get_stats(tmp_path / "missing.sqlite") == []
+
+
+def test_ledger_with_old_columns(tmp_path: Path) -> None:
+    path = tmp_path / "ledger.sqlite"
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE usage (timestamp, run_id, provider, model, prompt_tokens, "
+            "cached_tokens, output_tokens, latency, time_to_first_token, repo, "
+            "diff_size)"
+        )
+    connection.close()
+    with Ledger(path) as ledger:
+        ledger.record(_record("model", 1))
+    (model_stats,) = get_stats(path)
+    assert model_stats.requests == 1
+
+
+def test_stats_command(capsys: pytest.CaptureFixture[str]) -> None:
+    with pytest.raises(SystemExit) as exc_info:
+        app(["stats"])
+    assert exc_info.value.code == 1
+    assert "no requests recorded" in capsys.readouterr().err
+
+    with Ledger(get_ledger_path()) as ledger:
+        ledger.record(dataclasses.replace(_record("some-model", 1.5), timestamp=1e12))
+    with pytest.raises(SystemExit) as exc_info:
+        app(["stats"])
+    assert exc_info.value.code == 0
+    captured = capsys.readouterr().out
+    assert "some-model" in captured
+    assert "1.50" in captured
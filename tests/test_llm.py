@@ -0,0 +1,116 @@
+"""Tests for the llm module."""
+
+import asyncio
+import json
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.settings import ModelSettings
+
+from vibes.llm import (
+    CommitMessageResponse,
+    RepairModel,
+    count_retries,
+    describe_agent,
+    get_output_type,
+    repair_json,
+)
+
+EXPECTED = {"message": "✨ Add a feature", "emoji_legend": {"✨": "new"}}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"message": "✨ Add a feature", "emoji_legend": {"✨": "new"}}',
+        '```json\n{"message": "✨ Add a feature", "emoji_legend": {"✨": "new"}}\n```',
+        '{"message": "✨ Add a feature", "emoji_legend": {"✨": "new",},}',
+    ],
+)
+def test_repair_json(text: str) -> None:
+    assert json.loads(repair_json(text)) == EXPECTED
+
+
+@pytest.mark.parametrize(
+    "emoji_legend",
+    [
+        [{"✨": "new"}],
+        [{"emoji": "✨", "meaning": "new"}],
+        [["✨", "new"]],
+        ["✨: new"],
+    ],
+)
+def test_repair_json_emoji_legend(emoji_legend: list[object]) -> None:
+    text = json.dumps({"message": "✨ Add a feature", "emoji_legend": emoji_legend})
+    assert json.loads(repair_json(text)) == EXPECTED
+
+
+def test_repair_json_keeps_commas_in_strings() -> None:
+    text = '{"message": "a,}" ,  "emoji_legend": {"✨": "new, \\"ok\\",]"},}'
+    assert json.loads(repair_json(text)) == {
+        "message": "a,}",
+        "emoji_legend": {"✨": 'new, "ok",]'},
+    }
+
+
+def test_repair_json_keeps_unrepairable_output() -> None:
+    assert repair_json('{"message": ') == '{"message": '
+    assert repair_json("[1, 2]") == "[1, 2]"
+
+
+def _malformed_model() -> FunctionModel:
+    """Get a model that answers with a fenced JSON, or a list emoji legend."""
+
+    def respond(_history: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        if info.output_tools:
+            args = {"message": EXPECTED["message"], "emoji_legend": [["✨", "new"]]}
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+        text = json.dumps(EXPECTED, ensure_ascii=False).replace('"}}', '",},}')
+        return ModelResponse(parts=[TextPart(f"```json\n{text}\n```")])
+
+    return FunctionModel(respond)
+
+
+@pytest.mark.parametrize("mode", ["tool", "prompted", "native"])
+def test_repair_model_avoids_retries(mode: str) -> None:
+    agent = Agent(RepairModel(_malformed_model()), output_type=get_output_type(mode))
+    result = asyncio.run(agent.run("prompt"))
+    assert isinstance(result.output, CommitMessageResponse)
+    assert result.output.message == EXPECTED["message"]
+    assert count_retries(result) == 0
+
+
+def test_count_retries() -> None:
+    # an output that can't be repaired is retried by the model
+    texts = iter(['{"message": ', json.dumps(EXPECTED)])
+
+    def respond(_history: list[ModelMessage], _info: AgentInfo) -> ModelResponse:
+        return ModelResponse(parts=[TextPart(next(texts))])
+
+    model = RepairModel(FunctionModel(respond))
+    agent = Agent(model, output_type=get_output_type("prompted"))
+    result = asyncio.run(agent.run("prompt"))
+    assert result.output.message == EXPECTED["message"]
+    assert count_retries(result) == 1
+
+
+def test_describe_agent() -> None:
+    def agent(
+        mode: str, timeout: float | None = None
+    ) -> Agent[None, CommitMessageResponse]:
+        return Agent(
+            RepairModel(TestModel()),
+            output_type=get_output_type(mode),
+            model_settings=ModelSettings(timeout=timeout) if timeout else None,
+        )
+
+    assert describe_agent(agent("tool")) == ["test:test", "ToolOutput", "timeout=None"]
+    descriptions = [
+        describe_agent(agent("tool")),
+        describe_agent(agent("native")),
+        describe_agent(agent("tool", timeout=10)),
+    ]
+    assert len({tuple(d) for d in descriptions}) == 3
@@ -8,7 +8,15 @@ from textwrap import dedent
 import git
 import pytest
 
-from vibes.prompt import get_prompt, get_repo_info
+from vibes.prompt import (
+    get_promisor_remote,
+    get_prompt,
+    get_repo_info,
+    iter_untracked_diff,
+    limit_untracked_paths,
+    list_untracked_files,
+    prefetch_blobs,
+)
 
 if sys.platform.startswith("win"):
     pytest.skip("skipping non-windows tests", allow_module_level=True)
@@ -275,3 +283,145 @@ def test_get_prompt_strips_description_whitespace(git_repo: GitRepo) -> None:
     prompt = get_prompt(git_repo.repo, "HEAD", "  padded  ")
     assert "padded" in prompt
     assert "  padded  " not in prompt
+
+
+def test_get_repo_info_with_untracked_files(git_repo: GitRepo) -> None:
+    """Test get_repo_info includes untracked files as new files."""
+    git_repo.path.joinpath("new_file").write_text("this is a new file\nline 2")
+    git_repo.path.joinpath(".gitignore").write_text("ignored_file\n")
+    git_repo.path.joinpath("ignored_file").write_text("this is ignored\n")
+    git_repo.path.joinpath("image.bin").write_bytes(b"\x89PNG\0\0\0")
+
+    result = get_repo_info(git_repo.repo, "")
+    expected_diff = dedent("""\
+        diff --git a/.gitignore b/.gitignore
+        new file mode 100644
+        --- /dev/null
+        +++ b/.gitignore
+        @@ -0,0 +1 @@
+        +ignored_file
+        diff --git a/image.bin b/image.bin
+        new file mode 100644
+        Binary files /dev/null and b/image.bin differ
+        diff --git a/new_file b/new_file
+        new file mode 100644
+        --- /dev/null
+        +++ b/new_file
+        @@ -0,0 +1,2 @@
+        +this is a new file
+        +line 2
+        \\ No newline at end of file""")
+    assert result["git_diff"] == expected_diff
+    assert (
+        result["git_ls_files"]
+        == "README.md\nsample_file\n.gitignore\nimage.bin\nnew_file"
+    )
+    assert result["message"] == ""
+
+
+def test_get_repo_info_ignores_untracked_files_when_staging(git_repo: GitRepo) -> None:
+    """Test untracked files are not part of a staged commit."""
+    git_repo.path.joinpath("new_file").write_text("this is a new file\n")
+    sample_file = git_repo.path.joinpath("sample_file")
+    sample_file.write_text("staged\n")
+    git_repo.repo.index.add([str(sample_file)])
+
+    result = get_repo_info(git_repo.repo, "")
+    assert "new_file" not in result["git_diff"]
+    assert "new_file" not in result["git_ls_files"]
+
+
+def test_iter_untracked_diff_limits(git_repo: GitRepo) -> None:
+    """Test large untracked files are truncated, and the total size is limited."""
+    big_file = git_repo.path.joinpath("big_file")
+    big_file.write_text("".join(f"line {i}\n" for i in range(10_000)))
+    for name in ["more_1", "more_2", "more_3"]:
+        git_repo.path.joinpath(name).write_text("x\n")
+    untracked_files = list_untracked_files(git_repo.repo)
+    assert untracked_files == ["big_file", "more_1", "more_2", "more_3"]
+
+    lines = list(
+        iter_untracked_diff(
+            git_repo.repo, untracked_files, max_file_bytes=20, max_total_bytes=200
+        )
+    )
+    assert lines[4:] == [
+        "@@ -0,0 +1,2 @@",
+        "+line 0",
+        "+line 1",
+        "\\ File truncated, it has 98890 bytes",
+        "diff --git a/more_1 b/more_1",
+        "new file mode 100644",
+        "--- /dev/null",
+        "+++ b/more_1",
+        "@@ -0,0 +1 @@",
+        "+x",
+        "# 2 more untracked files are omitted",
+    ]
+
+
+def test_iter_untracked_diff_of_a_long_line(git_repo: GitRepo) -> None:
+    """Test a truncated file is noted, even if its first line doesn't fit."""
+    git_repo.path.joinpath("long_line").write_text("x" * 100 + "\n")
+    lines = list(iter_untracked_diff(git_repo.repo, ["long_line"], max_file_bytes=20))
+    assert lines[4:] == [
+        "@@ -0,0 +1 @@",
+        "+" + "x" * 20,
+        "\\ File truncated, it has 101 bytes",
+    ]
+
+
+def test_limit_untracked_paths() -> None:
+    """Test the listed untracked paths are limited in size."""
+    paths = [f"file_{i}" for i in range(10)]
+    assert limit_untracked_paths(paths) == paths
+    assert limit_untracked_paths(paths, max_total_bytes=20) == [
+        "file_0",
+        "file_1",
+        "# 8 more untracked files",
+    ]
+
+
+def test_get_repo_info_in_bare_repo(git_repo: GitRepo, tmp_path: Path) -> None:
+    """Test a bare repo gives the same commit range info, and falls back to HEAD."""
+    with git.Repo.clone_from(git_repo.path, tmp_path / "bare.git", bare=True) as bare:
+        assert get_promisor_remote(bare) is None
+        assert get_repo_info(bare, "HEAD~2..HEAD") == get_repo_info(
+            git_repo.repo, "HEAD~2..HEAD"
+        )
+        assert get_repo_info(bare, "") == get_repo_info(git_repo.repo, "HEAD")
+
+
+def test_get_repo_info_in_partial_clone(git_repo: GitRepo, tmp_path: Path) -> None:
+    """Test a blobless clone fetches only the blobs of the diff and the README."""
+    git_repo.repo.git.config("uploadpack.allowFilter", "true")
+    with git.Repo.clone_from(
+        f"file://{git_repo.path}",
+        tmp_path / "partial.git",
+        bare=True,
+        multi_options=["--filter=blob:none"],
+    ) as partial:
+        assert get_promisor_remote(partial) == "origin"
+        # both versions of sample_file, and the README
+        paths = ["sample_file", "README.md"]
+        assert prefetch_blobs(partial, "HEAD~2", "HEAD", paths) == 3
+        assert prefetch_blobs(partial, "HEAD~2", "HEAD", paths) == 0
+        assert get_repo_info(partial, "HEAD~2..HEAD") == get_repo_info(
+            git_repo.repo, "HEAD~2..HEAD"
+        )
+        # the blob of the middle commit wasn't needed, so it wasn't fetched
+        missing = partial.git.rev_list("--objects", "--missing=print", "--all")
+        assert missing.count("?") == 1
+
+
+def test_prefetch_blobs_failure(git_repo: GitRepo, tmp_path: Path) -> None:
+    """Test a failed prefetch is skipped, to let git fetch lazily."""
+    git_repo.repo.git.config("uploadpack.allowFilter", "true")
+    with git.Repo.clone_from(
+        f"file://{git_repo.path}",
+        tmp_path / "partial.git",
+        bare=True,
+        multi_options=["--filter=blob:none"],
+    ) as partial:
+        partial.git.remote("set-url", "origin", f"file://{tmp_path / 'missing'}")
+        assert prefetch_blobs(partial, "HEAD~2", "HEAD", ["sample_file"]) == 0
@@ -0,0 +1,179 @@
+"""Tests for the session module."""
+
+import os
+from collections.abc import Generator
+from pathlib import Path
+
+import git
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    UserPromptPart,
+)
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pytest_mock import MockerFixture
+
+from vibes.cli import app
+from vibes.llm import CommitMessageResponse
+from vibes.session import (
+    Session,
+    get_session_path,
+    get_sessions_dir,
+    hash_files,
+    load_session,
+    prune_sessions,
+    save_session,
+)
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Generator[git.Repo]:
+    repo = git.Repo.init(tmp_path / "repo")
+    for name in ["a.txt", "b.txt"]:
+        (tmp_path / "repo" / name).write_text(f"{name}\n")
+    repo.index.add(["a.txt", "b.txt"])
+    repo.index.commit("init")
+    yield repo
+    repo.close()
+
+
+class RecordingModel(FunctionModel):
+    """A model that records the user prompts and the history length of requests."""
+
+    def __init__(self) -> None:
+        self.requests: list[tuple[str, int]] = []
+        super().__init__(self._respond)
+
+    def _respond(self, history: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        request = history[-1]
+        assert isinstance(request, ModelRequest)
+        prompts = [p.content for p in request.parts if isinstance(p, UserPromptPart)]
+        self.requests.append((str(prompts[-1]), len(history)))
+        reply = f"✨ Reply {len(self.requests)}"
+        if not info.output_tools:
+            return ModelResponse(parts=[TextPart(reply)])
+        args = {"message": reply, "emoji_legend": {}}
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+
+def test_session_path_is_keyed_by_branch(repo: git.Repo, cache_dir: Path) -> None:
+    path_main = get_session_path(repo)
+    assert path_main.parent == cache_dir / "sessions"
+    repo.git.checkout("-b", "other")
+    assert get_session_path(repo) != path_main
+
+
+def test_save_and_load_session(tmp_path: Path) -> None:
+    session = Session(
+        head="abc",
+        prompt_hash="def",
+        file_hashes=hash_files({"a.txt": "diff a"}),
+        messages=[ModelRequest(parts=[UserPromptPart("hi")])],
+        last_output="✨ Reply",
+    )
+    save_session(tmp_path / "s.json", session)
+    assert load_session(tmp_path / "s.json") == session
+    assert load_session(tmp_path / "missing.json") is None
+    (tmp_path / "bad.json").write_text("{}")
+    assert load_session(tmp_path / "bad.json") is None
+
+
+def test_prune_sessions(cache_dir: Path) -> None:
+    session = Session(
+        head="", prompt_hash="", file_hashes={}, messages=[], last_output=""
+    )
+    for i in range(5):
+        save_session(get_sessions_dir() / f"{i}.json", session)
+        os.utime(get_sessions_dir() / f"{i}.json", (i, i))
+    prune_sessions(2)
+    assert sorted(p.name for p in (cache_dir / "sessions").iterdir()) == [
+        "3.json",
+        "4.json",
+    ]
+
+
+def test_changed_files() -> None:
+    session = Session(
+        head="",
+        prompt_hash="",
+        file_hashes=hash_files({"a": "diff a", "b": "diff b", "c": "diff c"}),
+        messages=[],
+        last_output="",
+    )
+    updated, removed = session.changed_files({"a": "diff a", "b": "new b", "d": "d"})
+    assert updated == {"b": "new b", "d": "d"}
+    assert removed == ["c"]
+
+
+def test_rerun_sends_only_the_delta(
+    repo: git.Repo, mocker: MockerFixture, capsys: pytest.CaptureFixture[str]
+) -> None:
+    model = RecordingModel()
+    mocker.patch(
+        "vibes.cli.get_agent",
+        return_value=Agent(model, output_type=CommitMessageResponse),
+    )
+    repo_path = Path(repo.working_dir)
+    args = ["--repo", str(repo_path), "-s"]
+
+    (repo_path / "a.txt").write_text("a.txt changed\n")
+    repo.index.add(["a.txt"])
+    app(args, result_action="return_value")
+    assert "a.txt changed" in model.requests[-1][0]
+
+    # staging another file sends only that file, on top of the history
+    (repo_path / "b.txt").write_text("b.txt changed\n")
+    repo.index.add(["b.txt"])
+    app(args, result_action="return_value")
+    delta_prompt, history_length = model.requests[-1]
+    assert "b.txt changed" in delta_prompt
+    assert "a.txt changed" not in delta_prompt
+    assert "README" not in delta_prompt
+    assert history_length == 3
+    assert "✨ Reply 2" in capsys.readouterr().out
+
+    # nothing changed, so no request is sent
+    app(args, result_action="return_value")
+    assert len(model.requests) == 2
+    assert "✨ Reply 2" in capsys.readouterr().out
+
+    # --new ignores the previous session
+    app([*args, "--new"], result_action="return_value")
+    assert len(model.requests) == 3
+    assert model.requests[-1][1] == 1
+    assert "✨ Reply 3" in capsys.readouterr().out
+
+    # a new commit starts a new session
+    repo.index.commit("commit")
+    (repo_path / "a.txt").write_text("a.txt changed again\n")
+    app(args, result_action="return_value")
+    assert model.requests[-1][1] == 1
+
+
+def test_resume(
+    repo: git.Repo, mocker: MockerFixture, capsys: pytest.CaptureFixture[str]
+) -> None:
+    model = RecordingModel()
+    mocker.patch(
+        "vibes.cli.get_agent",
+        return_value=Agent(model, output_type=CommitMessageResponse),
+    )
+    repo_path = Path(repo.working_dir)
+    (repo_path / "a.txt").write_text("a.txt changed\n")
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["--repo", str(repo_path), "--resume"])
+    assert exc_info.value.code == 1
+    assert "no previous session" in capsys.readouterr().err
+
+    app(["--repo", str(repo_path), "-s"], result_action="return_value")
+    mocker.patch("builtins.input", side_effect=["make it shorter", "q"])
+    app(["--repo", str(repo_path), "--resume"], result_action="return_value")
+    assert len(model.requests) == 2
+    assert model.requests[-1] == ("make it shorter", 3)
+    assert "✨ Reply 1" in capsys.readouterr().out
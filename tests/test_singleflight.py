@@ -0,0 +1,136 @@
+"""Tests for the singleflight module."""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+
+import pytest
+
+from vibes.llm import CommitMessageResponse
+from vibes.singleflight import (
+    LOCK_TIMEOUT,
+    RESULT_MAX_AGE,
+    FlightResult,
+    LockInfo,
+    flight_key,
+    get_flights_dir,
+    is_stale,
+    single_flight,
+)
+
+
+class CountingCall:
+    """A request that counts its calls."""
+
+    def __init__(self, delay: float = 0) -> None:
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self) -> FlightResult:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        output = CommitMessageResponse(message=f"Reply {self.calls}", emoji_legend={})
+        return FlightResult(output=output, messages=[])
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", ""])
+    proc.wait()
+    return proc.pid
+
+
+def _write_lock(key: str, lock_info: LockInfo) -> None:
+    get_flights_dir().mkdir(parents=True, exist_ok=True)
+    lock_path = get_flights_dir() / f"{key}.lock"
+    lock_path.write_text(json.dumps(asdict(lock_info)))
+
+
+def test_concurrent_flights_share_one_request() -> None:
+    call = CountingCall(delay=0.5)
+
+    async def run_both() -> tuple[tuple[FlightResult, bool], ...]:
+        return await asyncio.gather(
+            single_flight(flight_key("prompt"), call),
+            single_flight(flight_key("prompt"), call),
+        )
+
+    results = asyncio.run(run_both())
+    assert call.calls == 1
+    assert sorted(shared for _result, shared in results) == [False, True]
+    assert {result.output.message for result, _shared in results} == {"Reply 1"}
+    assert not list(get_flights_dir().glob("*.lock"))
+
+
+def test_finished_result_is_not_reused() -> None:
+    call = CountingCall()
+    asyncio.run(single_flight(flight_key("prompt"), call))
+    result, shared = asyncio.run(single_flight(flight_key("prompt"), call))
+    # a rerun isn't concurrent, so it gets a new result
+    assert (call.calls, shared, result.output.message) == (2, False, "Reply 2")
+
+
+def test_key_is_scoped() -> None:
+    assert flight_key("prompt", "openai:gpt-5") != flight_key("prompt", "test:test")
+    call = CountingCall(delay=0.5)
+
+    async def run_both() -> tuple[tuple[FlightResult, bool], ...]:
+        return await asyncio.gather(
+            single_flight(flight_key("prompt", "openai:gpt-5"), call),
+            single_flight(flight_key("prompt", "test:test"), call),
+        )
+
+    results = asyncio.run(run_both())
+    assert call.calls == 2
+    assert [shared for _result, shared in results] == [False, False]
+
+
+def test_old_results_are_pruned() -> None:
+    asyncio.run(single_flight(flight_key("prompt"), CountingCall()))
+    (result_path,) = get_flights_dir().glob("*.json")
+    old_time = time.time() - RESULT_MAX_AGE - 1
+    os.utime(result_path, (old_time, old_time))
+    asyncio.run(single_flight(flight_key("another prompt"), CountingCall()))
+    assert result_path not in list(get_flights_dir().glob("*.json"))
+
+
+def test_failed_request_releases_the_lock() -> None:
+    async def fail() -> FlightResult:
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(single_flight(flight_key("prompt"), fail))
+    call = CountingCall()
+    asyncio.run(single_flight(flight_key("prompt"), call))
+    assert call.calls == 1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="no pid check on windows")
+def test_lock_of_dead_process_is_taken_over() -> None:
+    lock_info = LockInfo(pid=_dead_pid(), host=socket.gethostname(), time=time.time())
+    _write_lock(flight_key("prompt"), lock_info)
+    call = CountingCall()
+    _result, shared = asyncio.run(single_flight(flight_key("prompt"), call))
+    assert (call.calls, shared) == (1, False)
+    assert not list(get_flights_dir().glob("*.lock*"))
+
+
+def test_old_lock_is_taken_over() -> None:
+    old_time = time.time() - LOCK_TIMEOUT - 1
+    lock_info = LockInfo(pid=os.getpid(), host="another-host", time=old_time)
+    _write_lock(flight_key("prompt"), lock_info)
+    call = CountingCall()
+    asyncio.run(single_flight(flight_key("prompt"), call))
+    assert call.calls == 1
+
+
+def test_is_stale() -> None:
+    host = socket.gethostname()
+    assert not is_stale(LockInfo(pid=os.getpid(), host=host, time=time.time()))
+    assert not is_stale(LockInfo(pid=1, host="another-host", time=time.time()))
+    old_time = time.time() - LOCK_TIMEOUT - 1
+    assert is_stale(LockInfo(pid=os.getpid(), host=host, time=old_time))
@@ -0,0 +1,165 @@
+"""Tests for the workspace module."""
+
+import asyncio
+from collections.abc import Generator
+from pathlib import Path
+
+import git
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+
+from vibes.cli import app
+from vibes.config import Settings
+from vibes.llm import CommitMessageResponse
+from vibes.workspace import (
+    find_dirty_repos,
+    gather_repo_infos,
+    generate_messages,
+    get_workspace_prompts,
+    repo_name,
+)
+
+
+def _init_repo(path: Path, filename: str) -> git.Repo:
+    path.mkdir(parents=True, exist_ok=True)
+    repo = git.Repo.init(path)
+    (path / filename).write_text("initial\n")
+    repo.index.add([filename])
+    repo.index.commit("init")
+    return repo
+
+
+@pytest.fixture
+def workspace_root(tmp_path: Path) -> Generator[Path]:
+    """Get a workspace with two dirty repos, a clean repo and a nested repo."""
+    repos = [
+        _init_repo(tmp_path / "alpha", "a.txt"),
+        _init_repo(tmp_path / "beta", "b.txt"),
+        _init_repo(tmp_path / "clean", "c.txt"),
+        _init_repo(tmp_path / "alpha" / "vendor" / "nested", "n.txt"),
+    ]
+    (tmp_path / "alpha" / "a.txt").write_text("changed alpha\n")
+    (tmp_path / "beta" / "b.txt").write_text("changed beta\n")
+    repos[1].index.add(["b.txt"])
+    (tmp_path / "alpha" / "vendor" / "nested" / "n.txt").write_text("changed\n")
+    yield tmp_path
+    for repo in repos:
+        repo.close()
+
+
+def test_find_dirty_repos(workspace_root: Path) -> None:
+    assert find_dirty_repos(workspace_root) == [
+        workspace_root / "alpha",
+        workspace_root / "alpha" / "vendor" / "nested",
+        workspace_root / "beta",
+    ]
+
+
+def test_find_dirty_repos_with_submodule(tmp_path: Path) -> None:
+    sub_repo = _init_repo(tmp_path / "upstream", "s.txt")
+    super_repo = _init_repo(tmp_path / "super", "p.txt")
+    super_repo.git.execute(
+        [
+            *("git", "-c", "protocol.file.allow=always"),
+            *("submodule", "add", str(tmp_path / "upstream"), "sub"),
+        ]
+    )
+    super_repo.index.commit("add submodule")
+    (tmp_path / "super" / "sub" / "s.txt").write_text("changed submodule\n")
+
+    assert find_dirty_repos(tmp_path / "super") == [
+        tmp_path / "super",
+        tmp_path / "super" / "sub",
+    ]
+    sub_repo.close()
+    super_repo.close()
+
+
+def test_broken_repo_is_reported(
+    workspace_root: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    (workspace_root / "broken").mkdir()
+    (workspace_root / "broken" / ".git").write_text("gitdir: missing\n")
+    repo_paths = find_dirty_repos(workspace_root)
+    assert workspace_root / "broken" in repo_paths
+    repo_infos = gather_repo_infos(repo_paths, Settings(concurrency=2))
+    assert isinstance(repo_infos[workspace_root / "broken"], Exception)
+
+    with pytest.raises(SystemExit) as exc_info:
+        app(["workspace", str(workspace_root), "--only-prompt"])
+    assert exc_info.value.code == 1
+    captured = capsys.readouterr()
+    assert "can't read broken" in captured.err
+    assert "# alpha\n" in captured.out
+
+
+def test_gather_repo_infos_follows_the_diff_settings(workspace_root: Path) -> None:
+    repo_paths = [workspace_root / "beta"]
+    settings = Settings(adaptive_diff=True, concurrency=2)
+    repo_info = gather_repo_infos(repo_paths, settings)[workspace_root / "beta"]
+    assert not isinstance(repo_info, Exception)
+    # a prose file is diffed by words
+    assert "{+changed beta+}" in repo_info["git_diff"]
+
+
+def test_get_workspace_prompts_share_summary(workspace_root: Path) -> None:
+    repo_paths = find_dirty_repos(workspace_root)
+    repo_infos = {
+        repo_path: repo_info
+        for repo_path, repo_info in gather_repo_infos(
+            repo_paths, Settings(concurrency=2)
+        ).items()
+        if not isinstance(repo_info, Exception)
+    }
+    assert "changed beta" in repo_infos[workspace_root / "beta"]["git_diff"]
+
+    prompts = get_workspace_prompts(repo_infos, workspace_root, "Rename things")
+    summary = """\
+Rename things
+
+This change is part of a cross-repo change, that modifies:
+- alpha:
+  - a.txt
+- alpha/vendor/nested:
+  - n.txt
+- beta:
+  - b.txt
+"""
+    assert list(prompts) == repo_paths
+    for prompt in prompts.values():
+        assert summary in prompt
+
+
+def test_repo_name_of_root(workspace_root: Path) -> None:
+    assert repo_name(workspace_root / "beta", workspace_root) == "beta"
+    assert repo_name(workspace_root, workspace_root) == workspace_root.name
+
+
+def test_generate_messages() -> None:
+    agent = Agent(TestModel(), output_type=CommitMessageResponse)
+    prompts = {Path("a"): "prompt a", Path("b"): "prompt b"}
+    responses = asyncio.run(generate_messages(agent, prompts, concurrency=1))
+    assert list(responses) == list(prompts)
+    assert all(isinstance(r, CommitMessageResponse) for r in responses.values())
+
+
+def test_workspace_only_prompt(
+    workspace_root: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    with pytest.raises(SystemExit) as exc_info:
+        app(["workspace", str(workspace_root), "--only-prompt"])
+    assert exc_info.value.code == 0
+    captured = capsys.readouterr().out
+    assert "# alpha\n" in captured
+    assert "# beta\n" in captured
+    assert "changed alpha" in captured
+
+
+def test_workspace_no_dirty_repos(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    with pytest.raises(SystemExit) as exc_info:
+        app(["workspace", str(tmp_path)])
+    assert exc_info.value.code == 1
+    assert "no dirty repos" in capsys.readouterr().err